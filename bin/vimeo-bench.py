@@ -0,0 +1,499 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Python module for Vimeo
+#
+# This is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Plopifier.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+Micro-benchmarks for python-vimeo. None of them talk to vimeo.com, the
+responses are synthetic.
+"""
+
+import BaseHTTPServer
+import SocketServer
+import cgi
+import hashlib
+import json
+import optparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import timeit
+import urlparse
+from cStringIO import StringIO
+
+import vimeo
+import vimeo.cache
+from vimeo.concurrency import WorkerPool
+
+
+def video(i):
+    return {"id" : str(i), "title" : "Video %d" % i,
+            "description" : "Some description " * 8,
+            "upload_date" : "2010-06-01 12:00:00",
+            "owner" : {"id" : "1234", "display_name" : "Someone"}}
+
+
+class FakeConnection(object):
+    """
+    Stands in for oauth2.Client, answering every call after some latency.
+    """
+    def __init__(self, latency):
+        self.latency = latency
+
+    def request(self, uri, method="GET", body=None, headers=None):
+        params = dict(urlparse.parse_qsl(urlparse.urlparse(uri).query))
+        time.sleep(self.latency)
+        return {"status" : "200"}, json.dumps(
+                    {"stat" : "ok", "generated_in" : "0.01",
+                     "video" : [video(int(params.get("video_id", 0)))]})
+
+
+def video_xml(i):
+    return ('<video id="%d"><title>Video %d</title><description>%s'
+            '</description><upload_date>2010-06-01 12:00:00</upload_date>'
+            '<owner id="1234" display_name="Someone"/></video>' %
+            (i, i, "Some description " * 8))
+
+
+def listing_file(items, format="json"):
+    """
+    Returns a temporary file holding a videos_getUploaded(full_response=1)
+    like response in the given format with the given number of items.
+    """
+    listing = tempfile.TemporaryFile()
+    if format == "xml":
+        listing.write('<?xml version="1.0" encoding="utf-8"?>'
+                      '<rsp generated_in="0.5" stat="ok"><videos page="1" '
+                      'perpage="%d" total="%d">' % (items, items))
+        for i in xrange(items):
+            listing.write(video_xml(i))
+        listing.write("</videos></rsp>")
+    else:
+        listing.write('{"generated_in":"0.5","stat":"ok","videos":{'
+                      '"page":"1","perpage":"%d","total":"%d","video":[' %
+                      (items, items))
+        for i in xrange(items):
+            if i:
+                listing.write(",")
+            listing.write(json.dumps(video(i)))
+        listing.write("]}}")
+    listing.seek(0)
+    return listing
+
+
+def in_child(function, *args):
+    """
+    Runs function in a child process and returns its duration and the
+    child's peak RSS in KiB.
+    """
+    pid = os.fork()
+    if not pid:
+        try:
+            function(*args)
+        finally:
+            os._exit(0)
+    start = time.time()
+    _, _, usage = os.wait4(pid, 0)
+    return time.time() - start, usage.ru_maxrss
+
+
+def fake_client(cls, latency, connection=FakeConnection, **kwargs):
+    client = cls("key", "secret", format="json", **kwargs)
+    client._connections.factory = lambda: connection(latency)
+    return client
+
+
+def report(label, seconds, count, unit="call"):
+    print "%-30s %10.2f us/%s" % (label, seconds * 1e6 / count, unit)
+
+
+def bench_cache(options):
+    """
+    Hit latency of each cache backend for a getInfo-sized response.
+    """
+    tmpdir = tempfile.mkdtemp()
+    try:
+        backends = [
+            ("MemoryCache", vimeo.cache.MemoryCache()),
+            ("SQLiteCache", vimeo.cache.SQLiteCache(
+                                        os.path.join(tmpdir, "cache.db"))),
+            ("MmapCache", vimeo.cache.MmapCache(
+                                        os.path.join(tmpdir, "cache.mmap"))),
+            ]
+        keys = [("vimeo_videos_getInfo",
+                 frozenset([("video_id", str(i)), ("format", "json")]))
+                for i in xrange(options.keys)]
+        for label, backend in backends:
+            for i, key in enumerate(keys):
+                backend.put(key, [video(i)], timeout=3600)
+            def hits():
+                for key in keys:
+                    backend.get(key)
+            seconds = min(timeit.repeat(hits, number=1, repeat=options.repeat))
+            report(label, seconds, len(keys), "hit")
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def bench_async(options):
+    """
+    getInfo calls for distinct videos with the same latency and concurrency:
+    the sync client driven by a thread pool, and the async client.
+    """
+    latency = options.latency / 1000.0
+    calls = options.calls
+
+    client = fake_client(vimeo.VimeoClient, latency,
+                         pool_size=options.concurrency)
+    pool = WorkerPool(options.concurrency)
+    start = time.time()
+    futures = [pool.submit(client.videos_getInfo, video_id=i)
+               for i in xrange(calls)]
+    for future in futures:
+        future.result()
+    report("VimeoClient + WorkerPool", time.time() - start, calls)
+
+    client = fake_client(vimeo.AsyncVimeoClient, latency,
+                         concurrency=options.concurrency)
+    start = time.time()
+    futures = [client.videos_getInfo(video_id=i) for i in xrange(calls)]
+    for future in futures:
+        future.result()
+    report("AsyncVimeoClient", time.time() - start, calls)
+
+
+def bench_threads(options):
+    """
+    One client shared by 1 to 16 threads making getInfo calls, each video
+    being asked for by 4 calls. Checks that every call gets its own video.
+    """
+    latency = options.latency / 1000.0
+    calls = options.calls
+    for threads in (1, 2, 4, 8, 16):
+        client = fake_client(vimeo.VimeoClient, latency, pool_size=threads)
+        wrong = []
+        def work(first):
+            for i in xrange(first, calls, threads):
+                video_id = i % max(calls // 4, 1)
+                response = client.videos_getInfo(video_id=video_id)
+                if response[0]["id"] != str(video_id):
+                    wrong.append(video_id)
+        workers = [threading.Thread(target=work, args=(first,))
+                   for first in xrange(threads)]
+        start = time.time()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        seconds = time.time() - start
+        print "%-30s %10.1f calls/s, %d requests, %d coalesced, %d wrong" % (
+            "%d threads" % threads, calls / seconds, client.inflight.calls,
+            client.inflight.coalesced, len(wrong))
+
+
+def bench_keys(options):
+    """
+    Cache hit rate for the same getInfo calls made in the different ways
+    callers make them: with int or str ids, unprocessed, or with options
+    left to None (like bin/vimeo-query.py does).
+    """
+    client = fake_client(vimeo.VimeoClient, 0)
+    variants = [{}, {"process" : False}, {"page" : None, "per_page" : None},
+                {"format" : "json", "process" : False}]
+    calls = 0
+    for i in xrange(options.keys):
+        for video_id in (i, str(i)):
+            for params in variants:
+                client.videos_getInfo(video_id=video_id, **params)
+                calls += 1
+    requests = client.inflight.calls
+    print "%-30s %10d calls, %d requests, %.1f%% hits" % (
+        "videos_getInfo", calls, requests, 100.0 * (calls - requests) / calls)
+
+
+def bench_entities(options):
+    """
+    Requests made by an enrichment job getting the info of every video of
+    a channel, batched with the channel's listing.
+    """
+    class ListingConnection(FakeConnection):
+        def request(self, uri, method="GET", body=None, headers=None):
+            params = dict(urlparse.parse_qsl(urlparse.urlparse(uri).query))
+            if params["method"] == "vimeo.videos.getInfo":
+                return FakeConnection.request(self, uri, method, body,
+                                              headers)
+            return {"status" : "200"}, json.dumps(
+                {"stat" : "ok", "generated_in" : "0.01",
+                 "videos" : {"page" : "1", "perpage" : str(options.items),
+                             "total" : str(options.items),
+                             "video" : [video(i)
+                                        for i in xrange(options.items)]}})
+
+    client = fake_client(vimeo.VimeoClient, 0, ListingConnection)
+    calls = [("channels_getVideos", {"channel_id" : "staffpicks",
+                                     "full_response" : 1,
+                                     "per_page" : options.items})]
+    calls.extend(("videos_getInfo", {"video_id" : i})
+                 for i in xrange(options.items))
+    client.batch(calls)
+    print "%-30s %10d calls, %d requests" % (
+        "batch", len(calls), client.inflight.calls)
+
+
+def bench_refresh(options):
+    """
+    Call latency for a hot key cached for 0.2s over 2s, plain, with
+    refresh_ahead and with stale_ttl.
+    """
+    latency = options.latency / 1000.0
+    for label, kwargs in (("plain", {}),
+                          ("refresh_ahead=0.25", {"refresh_ahead" : 0.25}),
+                          ("stale_ttl=0.2", {"stale_ttl" : 0.2})):
+        client = fake_client(vimeo.VimeoClient, latency, cache_timeout=0.2,
+                             **kwargs)
+        timings = []
+        end = time.time() + 2
+        while time.time() < end:
+            start = time.time()
+            client.videos_getInfo(video_id=1)
+            timings.append(time.time() - start)
+            time.sleep(0.001)
+        timings.sort()
+        print "%-30s %10.2f us p50, %.2f us p99, %.2f us max, %d slow" % (
+            label, timings[len(timings) // 2] * 1e6,
+            timings[len(timings) * 99 // 100] * 1e6, timings[-1] * 1e6,
+            sum(1 for timing in timings if timing >= latency))
+
+
+class UploadHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Stands in for an upload endpoint (and verifyManifest), reading request
+    bodies at most at the server's bandwidth per connection and answering
+    with the MD5 of the file data.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = StringIO()
+        remaining = int(self.headers["Content-Length"])
+        start = time.time()
+        while remaining:
+            block = self.rfile.read(min(remaining, 64 * 1024))
+            body.write(block)
+            remaining -= len(block)
+            delay = start + body.tell() / self.server.bandwidth - time.time()
+            if delay > 0:
+                time.sleep(delay)
+        body.seek(0)
+        form = cgi.FieldStorage(fp=body, headers=self.headers,
+                                environ={"REQUEST_METHOD" : "POST"})
+        if "file_data" in form:
+            answer = hashlib.md5(form["file_data"].value).hexdigest()
+        else:
+            answer = json.dumps({"stat" : "ok", "generated_in" : "0.01",
+                                 "ticket" : {"id" : form.getfirst("ticket_id")}})
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(answer)))
+        self.end_headers()
+        self.wfile.write(answer)
+
+
+class UploadServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, bandwidth):
+        BaseHTTPServer.HTTPServer.__init__(self, ("127.0.0.1", 0),
+                                           UploadHandler)
+        self.bandwidth = bandwidth
+        self.url = "http://127.0.0.1:{0}/upload".format(self.server_port)
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+
+def bench_upload(options):
+    """
+    Chunked upload throughput over 1 to 8 connections, to a local endpoint
+    capped at --bandwidth MB/s per connection.
+    """
+    import vimeo.convenience
+
+    server = UploadServer(options.bandwidth * 1e6)
+    upload = tempfile.NamedTemporaryFile()
+    upload.write(os.urandom(options.upload_size * 1000000))
+    upload.flush()
+    client = fake_client(vimeo.VimeoClient, 0)
+    try:
+        for connections in (1, 2, 4, 8):
+            uploader = vimeo.convenience.VimeoUploader(
+                client, {"endpoint" : server.url, "id" : "ticket",
+                         "max_file_size" : options.upload_size * 1000000})
+            uploader.api_url = server.url
+            start = time.time()
+            uploader.upload(upload.name, chunk=True, connections=connections,
+                            chunk_size=1000000)
+            print "%-30s %10.2f MB/s" % (
+                "%d connection(s)" % connections,
+                options.upload_size / (time.time() - start))
+    finally:
+        server.shutdown()
+        upload.close()
+
+
+def bench_stream(options, format, processor):
+    listing = listing_file(options.items, format)
+
+    def whole():
+        listing.seek(0)
+        processor()({}, listing.read())
+
+    def streamed():
+        listing.seek(0)
+        for item in processor().iter_items(listing):
+            pass
+
+    for label, function in (("process", whole), ("iter_items", streamed)):
+        seconds, rss = in_child(function)
+        report("%s.%s" % (processor.__name__, label), seconds,
+               options.items, "item")
+        print "%-30s %10d KiB peak RSS" % ("", rss)
+
+
+def bench_json(options):
+    """
+    Parse throughput of JSONProcessor with each available json module, on
+    a videos_getInfo and a channels_getVideos(full_response=1) response.
+    """
+    payloads = [
+        ("videos_getInfo", json.dumps(
+                {"generated_in" : "0.01", "stat" : "ok",
+                 "video" : [video(1)]})),
+        ("channels_getVideos", json.dumps(
+                {"generated_in" : "0.1", "stat" : "ok",
+                 "videos" : {"page" : "1", "perpage" : "50", "total" : "500",
+                             "on_this_page" : "50",
+                             "video" : [video(i) for i in xrange(50)]}})),
+        ]
+    for name in vimeo.JSON_BACKENDS:
+        try:
+            processor = vimeo.JSONProcessor(json=name)
+        except ImportError:
+            print "%-30s not installed" % name
+            continue
+        for label, payload in payloads:
+            seconds = min(timeit.repeat(lambda: processor({}, payload),
+                                        number=options.calls,
+                                        repeat=options.repeat))
+            print "%-30s %10.2f MB/s" % (
+                "%s %s" % (name, label),
+                len(payload) * options.calls / seconds / 1e6)
+    print "default: %s" % vimeo.JSONProcessor().json.__name__
+
+
+def bench_json_stream(options):
+    """
+    Parsing a large json listing with JSONProcessor, whole or streamed.
+    """
+    bench_stream(options, "json", vimeo.JSONProcessor)
+
+
+def bench_views(options):
+    """
+    Memory taken by a client having cached --keys videos_getInfo responses
+    (with everything the client keeps along: the raw content, the
+    dependency index, the entity store...), with dicts and with views.
+    """
+    def fill(views):
+        client = fake_client(vimeo.VimeoClient, 0, views=views,
+                             cache_max_entries=options.keys)
+        for i in xrange(options.keys):
+            client.videos_getInfo(video_id=i)
+
+    _, baseline = in_child(lambda: None)
+    for label, views in (("dicts", False), ("views", True)):
+        seconds, rss = in_child(fill, views)
+        report("VimeoClient %s" % label, seconds, options.keys, "video")
+        print "%-30s %10.2f KiB/1000 videos" % (
+            "", (rss - baseline) * 1000.0 / options.keys)
+
+
+def bench_xml(options):
+    """
+    Parsing a videos_getInfo xml response, then a large xml listing whole
+    or streamed.
+    """
+    response = ('<?xml version="1.0" encoding="utf-8"?><rsp stat="ok" '
+                'generated_in="0.01"><videos>%s</videos></rsp>' % video_xml(1))
+    seconds = min(timeit.repeat(lambda: vimeo.XMLProcessor()({}, response),
+                                number=options.calls,
+                                repeat=options.repeat))
+    report("XMLProcessor (%s)" % vimeo.XMLProcessor.etree.__name__,
+           seconds, options.calls)
+    bench_stream(options, "xml", vimeo.XMLProcessor)
+
+
+BENCHMARKS = {"async" : bench_async,
+              "cache" : bench_cache,
+              "entities" : bench_entities,
+              "json" : bench_json,
+              "json-stream" : bench_json_stream,
+              "keys" : bench_keys,
+              "refresh" : bench_refresh,
+              "threads" : bench_threads,
+              "upload" : bench_upload,
+              "views" : bench_views,
+              "xml" : bench_xml}
+
+
+def main(argv):
+    parser = optparse.OptionParser(
+        usage='Usage: %prog [options] BENCHMARK...',
+        description="Run python-vimeo benchmarks: " +
+                    ", ".join(sorted(BENCHMARKS)))
+    parser.add_option('--keys', type="int", default=1000,
+                      help="Number of distinct cache keys")
+    parser.add_option('--repeat', type="int", default=5,
+                      help="Number of runs, the best one is reported")
+    parser.add_option('--calls', type="int", default=200,
+                      help="Number of API calls")
+    parser.add_option('--latency', type="float", default=20,
+                      help="Simulated API latency, in milliseconds")
+    parser.add_option('--concurrency', type="int", default=16,
+                      help="Number of concurrent API calls")
+    parser.add_option('--items', type="int", default=50000,
+                      help="Number of items in parsed listings")
+    parser.add_option('--upload-size', type="int", default=32,
+                      help="Size of the uploaded file, in MB")
+    parser.add_option('--bandwidth', type="float", default=10,
+                      help="Upload bandwidth per connection, in MB/s")
+
+    (options, args) = parser.parse_args(argv[1:])
+
+    for name in args or sorted(BENCHMARKS):
+        if name not in BENCHMARKS:
+            parser.error("Unknown benchmark %s" % name)
+        print "== %s" % name
+        BENCHMARKS[name](options)
+
+if __name__ == '__main__':
+    main(sys.argv)
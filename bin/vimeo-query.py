@@ -43,6 +43,8 @@ def main(argv):
                       help="Access token")
     parser.add_option('-y', '--access-token-secret',
                       help="Access token secret")
+    parser.add_option('--cache-file', metavar="FILE",
+                      help="Keep the responses cached between runs in FILE")
 
     parser.add_option('--album', metavar="ALBUM_ID",
                       action="append",
@@ -184,7 +186,8 @@ def main(argv):
                                vconfig.get("appli", "consumer_secret"),
                                token=vconfig.get("auth","token"),
                                token_secret=vconfig.get("auth", "token_secret"),
-                               format="json")
+                               format="json",
+                               cache_file=options.cache_file)
 
     if options.quota:
         quota = client.vimeo_videos_upload_getQuota()['upload_space']['free']
@@ -205,8 +208,12 @@ def main(argv):
             print "Missing channel"
             parser.print_help()
             sys.exit(-1)
-        for chan in options.channel:
-            info = client.vimeo_channels_getInfo(channel_id=chan)
+        infos = client.batch([("channels_getInfo", {"channel_id" : chan})
+                              for chan in options.channel])
+        for chan, info in zip(options.channel, infos):
+            if isinstance(info, vimeo.VimeoAPIError):
+                print "Channel %s: %s" % (chan, info)
+                continue
 
             for text_item in ['name', 'description', 'created_on', 'modified_on', 'total_videos',
                               'total_subscribers', 'logo_url', 'badge_url', 'url', 'featured_description']:
@@ -223,8 +230,12 @@ def main(argv):
             parser.print_help()
             sys.exit(-1)
 
-        for vid in options.video:
-            info = client.vimeo_videos_getInfo(video_id=vid)
+        infos = client.batch([("videos_getInfo", {"video_id" : vid})
+                              for vid in options.video])
+        for vid, info in zip(options.video, infos):
+            if isinstance(info, vimeo.VimeoAPIError):
+                print "Video %s: %s" % (vid, info)
+                continue
             ## TODO pretty print results ?
             pprint.pprint(info)
     elif options.get_uploaded_videos:
@@ -54,13 +54,27 @@ AUTHORIZATION_URL = 'http://vimeo.com/oauth/authorize'
 API_REST_URL = 'http://vimeo.com/api/rest/v2/'
 API_V2_CALL_URL = 'http://vimeo.com/api/v2/'
 
+import atexit
+import importlib
 import logging
+import os
+import sys
+import threading
 import time
 import urlparse
+import weakref
+from collections import deque
 from urllib import urlencode
 
 import oauth2
 
+from .cache import (CachedResponse, DependencyIndex, MemoryCache, MISSING,
+                    TTLPolicy, content_refs, param_refs)
+from .concurrency import ConnectionPool, Future, SingleFlight, WorkerPool
+from .methods import (API_METHODS, KNOWN_API_GROUPS, WRITE_METHODS,
+                      make_api_method)
+from .models import Entity, to_views
+
 # by default expects to find your key and secret in settings.py (django)
 # change this if they're someplace else (expecting strings for both)
 try:
@@ -97,79 +111,296 @@ class ConditionalLogger(object):
             logging.basicConfig(filename=ConditionalLogger.STAT_LOG_FILE,
                                 level=logging.DEBUG)
     def __getattr__(self, name):
+        # special methods (e.g. looked up when pickling) aren't logging's
+        if name.startswith("__"):
+            raise AttributeError(name)
         # Don't call something like self.something.something() if not LOG
         if LOG:
             return getattr(logging, name)
         else:
             return lambda *args, **kwargs : None
 
+class ParseState(object):
+    """
+    What a format processor knows about the response it is processing.
+
+    document holds the parsed response, which the get_error_* methods of
+    the processor read the error from.
+    """
+    __slots__ = ("headers", "content", "document", "status", "generated_in")
+
+    def __init__(self, headers, content, document=None):
+        self.headers = headers
+        self.content = content
+        self.document = document
+        self.status = self.generated_in = None
+
 class FormatProcessor(object):
     """
     Base class for format processors.
 
     Does no processing by default.
+
+    Processors keep no state of their own: everything about the response
+    being processed is kept in a ParseState. The same processor can thus
+    process several responses at once from different threads, and be
+    pickled to another process.
     """
+    # name of the attribute holding the module the processor parses with,
+    # pickled as the module's name since modules can't be
+    _backend = None
+
     def __init__(self):
-        self._status, self._generated_in = None, None
         self.log = ConditionalLogger()
-    def __call__(self, *args, **kwargs):
-        processed = self.process(*args, **kwargs)
-        try:
-            del self._processing
-        except AttributeError:
-            pass
-        return processed
 
-    @property
-    def status(self):
-        return self._status
-    @status.setter
-    def status(self, value):
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if self._backend is not None:
+            # the default module too, which the class only has once a
+            # processor was created in that process
+            state[self._backend] = getattr(self, self._backend).__name__
+        return state
+
+    def __setstate__(self, state):
+        state = dict(state)
+        if self._backend is not None:
+            state[self._backend] = importlib.import_module(
+                                                    state[self._backend])
+        self.__dict__.update(state)
+
+    def __call__(self, headers, content):
+        return self.process(headers, content)
+
+    def set_status(self, state, value):
         if value == "fail":
-            raise VimeoAPIError(error_code=self.get_error_code(),
-                                msg=self.get_error_msg(),
-                                explanation=self.get_error_explanation())
+            raise VimeoAPIError(error_code=self.get_error_code(state),
+                                msg=self.get_error_msg(state),
+                                explanation=self.get_error_explanation(state))
         self.log.info("Status: {0}".format(value))
-        self._status = value
-    @property
-    def generated_in(self):
-        return self._generated_in
-    @generated_in.setter
-    def generated_in(self, value):
+        state.status = value
+    def set_generated_in(self, state, value):
         self.log.info("Generated in: {0}".format(value))
-        self._generated_in = value
+        state.generated_in = value
     def process(self, headers, content):
-        self.headers = headers
-        self.content = content
-        return self.content
+        return content
+
+# json modules, in order of preference
+JSON_BACKENDS = ("ujson", "simplejson", "json")
+
+def _import_backend(names, what):
+    for name in names:
+        try:
+            return importlib.import_module(name)
+        except ImportError:
+            pass
+    raise ImportError("{0} not found.".format(what))
 
 class JSONProcessor(FormatProcessor):
     """
     JSON API processor.
+
+    Decodes with the first module of JSON_BACKENDS that can be imported,
+    which is looked up once. To use another one, pass its module (or module
+    name) as json, or set JSONProcessor.json to change the default. The
+    module needs a loads function, and a JSONDecoder class as well for
+    iter_items (the standard json module is used otherwise).
+
+    With views, videos, users, channels, albums and comments are returned
+    as the compact views of vimeo.models instead of dicts.
     """
+    json = None
+    _backend = "json"
+
+    def __init__(self, json=None, views=False):
+        FormatProcessor.__init__(self)
+        self.views = views
+        if isinstance(json, basestring):
+            json = importlib.import_module(json)
+        if json is not None:
+            self.json = json
+        elif JSONProcessor.json is None:
+            JSONProcessor.json = _import_backend(JSON_BACKENDS, "json")
+
     def process(self, headers, content):
-        import json
-        self._processing = json.loads(content)
+        # content is the raw str (bytes) of the response, all the backends
+        # decode it without another copy
+        state = ParseState(headers, content, self.json.loads(content))
+        document = state.document
 
-        self.status = self._processing.pop("stat")
-        self.generated_in = self._processing.pop("generated_in")
+        self.set_status(state, document.pop("stat"))
+        self.set_generated_in(state, document.pop("generated_in"))
 
         # response should only have the content we want now in a nested dict
-        if len(self._processing) is not 1:
+        if len(document) is not 1:
             # uh oh... this shouldn't have happened, hopefully the caller can
             # deal with it
             self.log.error("Unexpected response contained {0}".format(
-                                                    self._processing.keys()))
-            return self._processing
-        _, processed_content = self._processing.popitem()
+                                                    document.keys()))
+            return document
+        key, processed_content = document.popitem()
+        if self.views:
+            return to_views(key, processed_content)
         return processed_content
 
-    def get_error_msg(self):
-        return self._processing["err"].get("msg", None)
-    def get_error_code(self):
-        return self._processing["err"].get("code", None)
-    def get_error_explanation(self):
-        return self._processing["err"].get("expl", None)
+    def iter_items(self, stream, info=None, chunk_size=64 * 1024):
+        """
+        Parses a response incrementally from the file-like stream, yielding
+        the items of the listing it contains (or of the list of a single
+        entity response, like videos_getInfo) as soon as they are read.
+
+        Only the current item and a chunk_size buffer are kept in memory.
+        The other values of the listing (page, perpage, total...) are put
+        in the info dict if one is given. A failure status raises the
+        VimeoAPIError as soon as both the status and the error are read.
+        """
+        reader = _JSONReader(stream, chunk_size,
+                             getattr(self.json, "JSONDecoder", None))
+        if info is None:
+            info = {}
+        # the top level values, as far as we've read
+        state = ParseState(None, stream, {})
+        document = state.document
+
+        reader.expect("{")
+        for key in reader.iter_keys():
+            if reader.peek() == "[":
+                for item in reader.iter_list():
+                    yield item
+            elif reader.peek() == "{" and key != "err":
+                # the listing itself: {"page" : ..., "video" : [...]}
+                reader.expect("{")
+                for group_key in reader.iter_keys():
+                    if reader.peek() == "[":
+                        for item in reader.iter_list():
+                            yield item
+                    else:
+                        value = reader.value()
+                        if isinstance(value, dict):
+                            # a single item rather than a list of them
+                            yield value
+                        else:
+                            info[group_key] = value
+            else:
+                document[key] = reader.value()
+
+            if "stat" in document and (document["stat"] != "fail" or
+                                       "err" in document):
+                self.set_status(state, document.pop("stat"))
+        if "stat" in document:
+            # failed without saying why
+            document.setdefault("err", {})
+            self.set_status(state, document.pop("stat"))
+        if "generated_in" in document:
+            self.set_generated_in(state, document.pop("generated_in"))
+
+    def get_error_msg(self, state):
+        return state.document["err"].get("msg", None)
+    def get_error_code(self, state):
+        return state.document["err"].get("code", None)
+    def get_error_explanation(self, state):
+        return state.document["err"].get("expl", None)
+
+
+class _JSONReader(object):
+    """
+    Pulls JSON values one at a time from a file-like object, keeping only a
+    small window of the document in memory.
+    """
+    _WHITESPACE = " \t\n\r"
+
+    def __init__(self, stream, chunk_size, decoder=None):
+        if decoder is None:
+            import json
+            decoder = json.JSONDecoder
+        self._decode = decoder().raw_decode
+        self._stream = stream
+        self._chunk_size = chunk_size
+        self._buffer = ""
+        self._position = 0
+        self._eof = False
+
+    def _fill(self, size=None):
+        data = self._stream.read(size or self._chunk_size)
+        if not data:
+            self._eof = True
+            return False
+        self._buffer = self._buffer[self._position:] + data
+        self._position = 0
+        return True
+
+    def peek(self):
+        """
+        Returns the next significant character, or "" at the end.
+        """
+        while True:
+            buf, position = self._buffer, self._position
+            while position < len(buf) and buf[position] in self._WHITESPACE:
+                position += 1
+            self._position = position
+            if position < len(buf):
+                return buf[position]
+            if not self._fill():
+                return ""
+
+    def expect(self, character):
+        if self.peek() != character:
+            raise ValueError("Expected {0!r} at {1!r}".format(
+                character, self._buffer[self._position:self._position + 20]))
+        self._position += 1
+
+    def value(self):
+        """
+        Decodes the next complete value.
+        """
+        self.peek()
+        size = self._chunk_size
+        while True:
+            try:
+                value, end = self._decode(self._buffer, self._position)
+            except ValueError:
+                if self._eof or not self._fill(size):
+                    raise
+            else:
+                # a number may go on in data we haven't read yet
+                if end < len(self._buffer) or self._eof or not self._fill(size):
+                    self._position = end
+                    return value
+            # don't go through a huge value one chunk at a time
+            size *= 2
+
+    def iter_keys(self):
+        """
+        Iterates over the keys of the object being read, leaving each key's
+        value to be read by the caller. Expects the opening { to be read.
+        """
+        if self.peek() == "}":
+            self._position += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(":")
+            yield key
+            if self.peek() == ",":
+                self._position += 1
+            else:
+                self.expect("}")
+                return
+
+    def iter_list(self):
+        """
+        Iterates over the values of the list starting at the next character.
+        """
+        self.expect("[")
+        if self.peek() == "]":
+            self._position += 1
+            return
+        while True:
+            yield self.value()
+            if self.peek() == ",":
+                self._position += 1
+            else:
+                self.expect("]")
+                return
 
 
 class JSONPProcessor(FormatProcessor):
@@ -184,42 +415,86 @@ class PHPProcessor(FormatProcessor):
     """
     pass
 
+# ElementTree implementations, in order of preference (taken from lxml docs)
+XML_BACKENDS = ("lxml.etree", "xml.etree.cElementTree",
+                "xml.etree.ElementTree", "cElementTree",
+                "elementtree.ElementTree")
+
 class XMLProcessor(FormatProcessor):
     """
     XML API processor.
+
+    Parses with the first module of XML_BACKENDS that can be imported,
+    which is looked up once. To use another one, pass its module (or module
+    name) as etree, or set XMLProcessor.etree to change the default.
     """
+    etree = None
+    _backend = "etree"
+
+    def __init__(self, etree=None):
+        FormatProcessor.__init__(self)
+        if isinstance(etree, basestring):
+            etree = importlib.import_module(etree)
+        if etree is not None:
+            self.etree = etree
+        elif XMLProcessor.etree is None:
+            XMLProcessor.etree = _import_backend(XML_BACKENDS, "ElementTree")
+
     def process(self, headers, content):
-        # import chain taken from lxml docs
-        try:
-            from lxml import etree
-        except ImportError:
-            try:
-                import xml.etree.cElementTree as etree
-            except ImportError:
-                try:
-                    import xml.etree.ElementTree as etree
-                except ImportError:
-                    try:
-                        import cElementTree as etree
-                    except ImportError:
-                        try:
-                            import elementtree.ElementTree as etree
-                        except ImportError:
-                            raise ImportError("ElementTree not found.")
-        self._processing = etree.fromstring(content)
-
-        self.status = self._processing.get("stat")
-        self.generated_in = self._processing.get("generated_in")
-
-        processed_content = self._processing[0]
+        state = ParseState(headers, content, self.etree.fromstring(content))
+
+        self.set_status(state, state.document.get("stat"))
+        self.set_generated_in(state, state.document.get("generated_in"))
+
+        processed_content = state.document[0]
         return processed_content
 
-    def get_error_msg(self):
-        return self._processing[0].get("msg", None)
-    def get_error_code(self):
-        return self._processing[0].get("code", None)
-    def get_error_explanation(self):
-        return self._processing[0].get("expl", None)
+    def iter_items(self, stream, info=None):
+        """
+        Parses a response incrementally from the file-like stream, yielding
+        the elements of the listing it contains (e.g. each <video> of
+        <videos>) as soon as they are complete.
+
+        Yielded elements are detached from the document, which is never
+        held in memory as a whole. The attributes of the listing element
+        (page, perpage, total...) are put in the info dict if one is given.
+        A failure status raises the VimeoAPIError as soon as the error
+        element is read.
+        """
+        state = ParseState(None, stream)
+        depth = 0
+        root = listing = None
+        for event, element in self.etree.iterparse(stream,
+                                                   events=("start", "end")):
+            if event == "start":
+                depth += 1
+                if depth == 1:
+                    root = state.document = element
+                    if root.get("stat") != "fail":
+                        self.set_status(state, root.get("stat"))
+                        self.set_generated_in(state,
+                                              root.get("generated_in"))
+                elif depth == 2:
+                    listing = element
+                    if info is not None:
+                        info.update(element.attrib)
+                continue
+
+            depth -= 1
+            if depth == 1 and root.get("stat") == "fail":
+                self.set_status(state, "fail")
+            elif depth == 2:
+                # the builder still appends the next items to the cleared
+                # listing, so only the current item stays referenced
+                listing.clear()
+                yield element
+
+    def get_error_msg(self, state):
+        return state.document[0].get("msg", None)
+    def get_error_code(self, state):
+        return state.document[0].get("code", None)
+    def get_error_explanation(self, state):
+        return state.document[0].get("expl", None)
 
 
 class VimeoClient(object):
@@ -234,6 +509,8 @@ class VimeoClient(object):
             response content to do your own parsing on. Respects the object's
             default_response_format attribute or the "format" parameter.
 
+    Parameters set to None are left out of the request.
+
     For three legged authentication, use the get_request_token,
     get_authentication_url, set_verifier, and get_access_token methods.
 
@@ -242,26 +519,140 @@ class VimeoClient(object):
 
     By default, this client will cache API requests for 120 seconds. To
     override this setting, pass in a different cache_timeout parameter (in
-    seconds), or to disable caching, set cache_timeout to 0.
+    seconds), or to disable caching, set cache_timeout to 0. The cache holds
+    at most cache_max_entries responses and, if cache_max_bytes is given, at
+    most that many bytes of response content; the least recently used
+    responses are evicted first. Raw responses are cached, so calls with
+    and without process share their cache entry.
+
+    cache_ttls sets how long the responses of some methods are cached for
+    instead, as a sequence of (pattern, seconds) pairs where the first
+    matching pattern wins, e.g.:
+
+        [("channels_getInfo", 6 * 3600), ("activity_*", 10)]
+
+    0 seconds means never cached. With adaptive_ttl, the time the other
+    methods are cached for is tuned from how often their responses change.
+    See vimeo.cache.TTLPolicy, which the ttl_policy attribute is, and
+    cache_stats for the resulting hit, miss and change counts.
+
+    With refresh_ahead set to a fraction of the time responses are cached
+    for (e.g. 0.1), a response used in that last fraction of its time is
+    fetched again in the background, so that frequently used responses
+    don't expire. With stale_ttl, responses are kept that many seconds
+    after they expire and still served in the meantime while a single
+    background request refreshes them.
+
+    API errors (e.g. for a deleted video) are cached too, for error_ttl
+    seconds, and raised again with the same code, msg and explanation by
+    the calls they are served to. error_ttls maps error codes to their own
+    time, 0 meaning never cached: errors like 105 (service unavailable)
+    are never cached by default.
+
+    Calls that change something (vimeo.methods.WRITE_METHODS, like
+    videos_setTitle or channels_subscribe, and the uncatalogued methods
+    starting with add, remove, set, delete and so on) are never cached. Once they succeed, the cached responses mentioning the videos,
+    albums, channels, groups or users they were given (e.g. the video's
+    getInfo, and the album listings it appears in) are dropped, so long
+    cache timeouts don't leave stale responses behind.
+
+    Alternatively, pass in any backend from vimeo.cache as the cache
+    parameter, for example an SQLiteCache or MmapCache to share responses
+    between processes. The cache_* parameters are then ignored and the
+    backend's own timeout is used.
+
+    To keep the cache across runs of a program, give a cache_file: the
+    cache is loaded from it if it exists, and saved to it at exit and,
+    with cache_save_interval, after a response is fetched if the last save
+    is that many seconds old. Responses keep the time they expire at. This
+    needs the default cache, or a backend with save and load methods.
+
+    The videos, channels, groups and users returned in full in the json
+    format (by videos_getInfo, channels_getInfo, groups_getInfo and
+    people_getInfo, and the videos, channels and groups of listings with
+    full_response) are also kept on their own for as long, and json getInfo
+    calls for them are answered without a request. Responses in other
+    formats don't feed this entity store.
+
+    Identical calls made from several threads while the first one is still
+    waiting on the API are coalesced into that single request. The counters
+    of the inflight attribute tell how many requests were made (calls) and
+    how many were saved this way (coalesced).
+
+    With views set, json responses hold the compact views of vimeo.models
+    (Video, User...) instead of dicts, which take less memory to cache
+    (about 30% less for the whole client, see bin/vimeo-bench.py views).
+
+    A client can be shared by several threads. API calls are made over a
+    pool of at most pool_size keep-alive connections.
     """
 
     _CLIENT_HEADERS = {"User-agent" : "python-vimeo"}
-    _NO_CACHE = ("vimeo_videos_upload_getTicket",
-                 "vimeo_videos_upload_getQuota")
+    # API error codes -> how long the error is cached for, 0 for the
+    # transient ones that are never cached
+    _ERROR_TTLS = {"105" : 0}
+    # never cached, whatever the rules given by cache_ttls: the upload
+    # methods report on (or change) an upload in progress
+    _DEFAULT_TTLS = (("videos_upload_*", 0),)
+    # API methods missing from vimeo.methods.WRITE_METHODS whose name (after
+    # the last _) starts with one of these are taken as writes as well
+    _WRITE_PREFIXES = ("add", "clear", "create", "delete", "edit", "join",
+                       "leave", "remove", "set", "subscribe", "unsubscribe")
+    # API methods looking up a single entity -> its type, the parameter
+    # giving its id, and whether the entity comes in a list
+    _ENTITY_LOOKUPS = {"vimeo_channels_getInfo" : ("channel", "channel_id",
+                                                   False),
+                       "vimeo_groups_getInfo" : ("group", "group_id", False),
+                       "vimeo_people_getInfo" : ("user", "user_id", False),
+                       "vimeo_videos_getInfo" : ("video", "video_id", True)}
 
     def __init__(self, key=VIMEO_KEY, secret=VIMEO_SECRET, 
                  callback=VIMEO_CALLBACK_URL, format="xml", token=None, 
-                 token_secret=None, cache_timeout=120):
+                 token_secret=None, cache_timeout=120, cache_max_entries=10000,
+                 cache_max_bytes=None, cache=None, pool_size=4, views=False,
+                 cache_ttls=(), adaptive_ttl=False, refresh_ahead=0,
+                 stale_ttl=0, cache_file=None, cache_save_interval=None,
+                 error_ttl=30, error_ttls=None):
         # memoizing
-        self._cache = {}
-        self._timeouts = {}
-        self.cache_timeout = cache_timeout
+        if cache is None:
+            cache = MemoryCache(timeout=cache_timeout,
+                                max_entries=cache_max_entries,
+                                max_bytes=cache_max_bytes)
+        self._cache = cache
+        self.ttl_policy = TTLPolicy(self._DEFAULT_TTLS + tuple(cache_ttls),
+                                    adaptive=adaptive_ttl)
+        self.error_ttl = error_ttl
+        self.error_ttls = dict(self._ERROR_TTLS)
+        self.error_ttls.update((str(code), ttl)
+                               for code, ttl in (error_ttls or {}).items())
+        self.refresh_ahead = refresh_ahead
+        self.stale_ttl = stale_ttl
+        # runs the background refreshes
+        self._refresher = WorkerPool(pool_size)
+        self._dependencies = DependencyIndex()
+        # (type, id) -> entity, see _store_entities
+        self._entities = MemoryCache(timeout=cache.timeout,
+                                     max_entries=cache_max_entries)
+        self.inflight = SingleFlight()
+
+        self.cache_file = cache_file
+        self.cache_save_interval = cache_save_interval
+        self._saving = threading.Lock()
+        self._saved_at = time.time()
+        if cache_file is not None:
+            if not hasattr(cache, "save"):
+                raise VimeoError("{0} can't be saved to a file.".format(
+                                                    type(cache).__name__))
+            if os.path.exists(cache_file):
+                self.load_cache()
+            _saved_clients.add(self)
 
         self.default_response_format = format
-        self._processors = {"JSON" : JSONProcessor(),
+        self._processors = {"JSON" : JSONProcessor(views=views),
                             "JSONP" : JSONPProcessor(),
                             "PHP" : PHPProcessor(),
                             "XML" : XMLProcessor()}
+        self._default_processor = FormatProcessor()
 
         self.key = key
         self.secret = secret
@@ -279,6 +670,12 @@ class VimeoClient(object):
             self.token = None
 
         self.client = oauth2.Client(self.consumer, self.token)
+        # oauth2.Client isn't thread safe, API calls use their own
+        self._connections = ConnectionPool(self._new_connection,
+                                           size=pool_size)
+
+    def _new_connection(self):
+        return oauth2.Client(self.consumer, self.token)
 
     def __getattr__(self, name):
         """
@@ -288,62 +685,443 @@ class VimeoClient(object):
         Also allows leaving off the vimeo_ for convenience when calling a
         method, but if it's a newly added group of methods you may need to use
         the full syntax.
-        """
-        # anything on this list can have its methods called without adding
-        # vimeo_ to the beginning (so videos_getInfo works, for example)
-        KNOWN_API_GROUPS = ("activity", "albums", "channels", "contacts",
-                            "groups", "oauth", "people", "test", "videos")
 
-        if not name.startswith("vimeo"):
-            # convenience method?
-            if any(name.startswith(prefix) for prefix in KNOWN_API_GROUPS):
-                return getattr(self, "vimeo_" + name)
+        Only reached for methods missing from vimeo.methods.API_METHODS. The
+        method is then added to the class, so this only happens once per name.
+        """
+        if name.startswith("vimeo"):
+            full_name = name
+        elif name.startswith(KNOWN_API_GROUPS):
+            # convenience method
+            full_name = "vimeo_" + name
+        else:
             # otherwise, this probably isn't an API method
             raise AttributeError(
                 "No attribute found with the name {0}.".format(name))
 
+        api_method = make_api_method(full_name)
+        setattr(type(self), full_name, api_method)
+        setattr(type(self), name, api_method)
+        return getattr(self, name)
+
+    def _call(self, name, api_method, params):
+        """
+        Calls the API method api_method (e.g. vimeo.videos.getInfo), name
+        being its python name (e.g. vimeo_videos_getInfo).
+        """
         if LOG:
             logging.info(name)
 
-        # memoize cleanup
-        call_time = time.time()
-        # no iteritems, we're changing the dict
-        for k, v in self._timeouts.items():
-            if call_time - v > self.cache_timeout:
+        # change these before we memoize
+        params, process = self._prepare(params)
+
+        # memoize
+        if self._is_write(name):
+            response = self._write(api_method, params)
+        elif not self._cacheable(name):
+            response = self._request(api_method, params)
+        else:
+            key = self._cache_key(name, params)
+            cached = self._cached(name, key, params, process)
+            if cached is not MISSING:
+                return cached
+            self.ttl_policy.miss(name)
+            # identical calls already waiting on the API share that response
+            response = self.inflight.do(key, self._fetch, key, api_method,
+                                        params)
+        return self._respond(response, params, process)
+
+    # the generated API methods go through _dispatch, which subclasses can
+    # override to change how calls are made
+    _dispatch = _call
+
+    def _is_write(self, name):
+        return (name in WRITE_METHODS or
+                name.rpartition("_")[2].startswith(self._WRITE_PREFIXES))
+
+    def _cacheable(self, name):
+        return self.ttl_policy.rule(name) != 0 and not self._is_write(name)
+
+    def _prepare(self, params):
+        """
+        Returns the parameters to send for a call, without the ones set to
+        None and with the format filled in, and whether to process the
+        response.
+        """
+        process = params.pop("process", True)
+        params = dict((param, value) for param, value in params.iteritems()
+                      if value is not None)
+        params.setdefault("format", self.default_response_format)
+        return params, process
+
+    def _cache_key(self, name, params):
+        """
+        Returns the cache key of a call given its prepared parameters.
+        Values are compared as sent (video_id=1 is video_id="1"), and the
+        format is part of the key since the content differs.
+        """
+        return (name, tuple(sorted(
+                    (param, value if isinstance(value, basestring)
+                                  else str(value))
+                    for param, value in params.iteritems())))
+
+    def _cached(self, name, key, params, process):
+        """
+        Returns what a call returns from the cache or the entity store, or
+        MISSING.
+        """
+        response = self._cache.get(key, MISSING)
+        if response is not MISSING and response.fresh_until is not None:
+            now = time.time()
+            if now >= response.fresh_until + self.stale_ttl:
+                response = MISSING
+            elif now >= response.fresh_until:
+                # stale, served while it is refreshed
+                self._refresh(key, params)
+                self.ttl_policy.hit(name, stale=True)
+                return self._respond(response, params, process)
+            elif (response.fresh_until - now <
+                  self.refresh_ahead * (response.fresh_until -
+                                        response.fetched_at)):
+                self._refresh(key, params)
+        if response is not MISSING:
+            self.ttl_policy.hit(name)
+            return self._respond(response, params, process)
+        return self._stored(name, params, process)
+
+    def _refresh(self, key, params):
+        """
+        Fetches the response for key again in the background, unless it is
+        already being fetched.
+        """
+        name = key[0]
+        self.inflight.submit(key, self._refresher, self._fetch, key,
+                             name.replace("_", "."), params)
+
+    def _stored(self, name, params, process):
+        """
+        Answers a processed json lookup of a single entity (like
+        videos_getInfo) from the entity store, or returns MISSING.
+        """
+        lookup = self._ENTITY_LOOKUPS.get(name)
+        if (lookup is None or not process or params["format"] != "json" or
+            set(params) != set([lookup[1], "format"])):
+            return MISSING
+        entity = self._entities.get((lookup[0], str(params[lookup[1]])),
+                                    MISSING)
+        if entity is MISSING:
+            return MISSING
+        self.ttl_policy.hit(name)
+        return [entity] if lookup[2] else entity
+
+    def _store_entities(self, name, params, processed, ttl):
+        """
+        Puts the entities of a processed json response in the entity store
+        for ttl seconds: the entity of a lookup, or those of a listing with
+        full_response.
+        """
+        if params["format"] != "json":
+            return
+        if name in self._ENTITY_LOOKUPS:
+            found = [(self._ENTITY_LOOKUPS[name][0], processed)]
+        elif (str(params.get("full_response", "0")).lower()
+              not in ("0", "false", "") and isinstance(processed, dict)):
+            found = [(kind, processed.get(kind))
+                     for kind, _, _ in self._ENTITY_LOOKUPS.itervalues()]
+        else:
+            return
+
+        for kind, entities in found:
+            if entities is None:
+                continue
+            if not isinstance(entities, list):
+                entities = [entities]
+            for entity in entities:
+                id = entity.get("id")
+                if id is not None:
+                    self._entities.put((kind, str(id)), entity, timeout=ttl)
+
+    def _respond(self, response, params, process):
+        """
+        Returns what a call returns for a CachedResponse: its processed
+        content, or its headers and content if process is False.
+        """
+        if not process:
+            return response.headers, response.content
+        return response.process(self._processor(params["format"]))
+
+    def _processor(self, format):
+        return self._processors.get(format.upper(), self._default_processor)
+
+    def call(self, name, **params):
+        """
+        Calls the API method name, given like the client's method names
+        (videos_getInfo or vimeo_videos_getInfo), and returns the response.
+        Unlike the API methods of an AsyncVimeoClient, this always waits for
+        the response.
+        """
+        name = self._full_name(name)
+        return self._call(name, name.replace("_", "."), params)
+
+    def batch(self, calls, concurrency=8):
+        """
+        Makes several API calls concurrently and returns their responses in
+        the same order.
+
+        calls is a sequence of (name, params) pairs, name being given like
+        for the call method and params being a dict. A call failing with an
+        API error gets the VimeoAPIError instead of a response, any other
+        error is raised.
+
+        Cached responses are used without making a request, and identical
+        calls are only made once. At most concurrency requests (and no more
+        than the client's pool_size) are made at the same time.
+
+        The getInfo calls of videos, channels, groups and users are made
+        last, once the other calls are done, and those asking for entities
+        returned in full by the other calls (json listings with
+        full_response) are answered without a request. The API has no call
+        looking up several entities at once, so to get the info of many
+        videos, add the listings they are in to the batch.
+        """
+        responses = [None] * len(calls)
+        # cache key -> name, params, process, indexes of the calls sharing it
+        pending = {}
+        for index, (name, params) in enumerate(calls):
+            name = self._full_name(name)
+            params, process = self._prepare(dict(params))
+            if not self._cacheable(name):
+                # e.g. each call must get its own upload ticket
+                key = index
+            else:
+                key = self._cache_key(name, params), process
+                try:
+                    cached = self._cached(name, key[0], params, process)
+                except VimeoAPIError as e:
+                    cached = e
+                if cached is not MISSING:
+                    responses[index] = cached
+                    continue
+            pending.setdefault(key, (name, params, process, []))[3].append(
+                                                                        index)
+
+        if not pending:
+            return responses
+
+        lookups = [call for call in pending.itervalues()
+                   if call[0] in self._ENTITY_LOOKUPS]
+        others = [call for call in pending.itervalues()
+                  if call[0] not in self._ENTITY_LOOKUPS]
+
+        workers = WorkerPool(min(concurrency, len(pending)))
+
+        def make(calls):
+            futures = [(workers.submit(self._call, name,
+                                       name.replace("_", "."),
+                                       dict(params, process=process)),
+                        indexes)
+                       for name, params, process, indexes in calls]
+            for future, indexes in futures:
                 try:
-                    del self._cache[k]
-                except KeyError:
-                    pass
-                del self._timeouts[k]
-
-        def _do_vimeo_call(**params):
-            # change these before we memoize
-            params.setdefault("format", self.default_response_format)
-
-            # memoize
-            key = (name, frozenset(params.items()))
-            if not name in self._NO_CACHE:
-                self._timeouts.setdefault(key, call_time)
-                if key in self._cache:
-                    return self._cache[key]
-
-            # change these after we memoize, before calling the API
-            process = params.pop("process", True)
-            params["method"] = name.replace("_", ".")
-
-            request_uri = "{api_url}?&{params}".format(api_url=API_REST_URL,
-                                                      params=urlencode(params))
-            headers, content = self.client.request(uri=request_uri,
-                                                 headers=self._CLIENT_HEADERS)
-
-            # call the appropriate process method if process is True (default)
-            # and we have an appropriate processor method
-            processor = self._processors.get(params["format"].upper(),
-                                             FormatProcessor())
-            if name in self._NO_CACHE:
-                return processor(headers, content)
-            return self._cache.setdefault(key, processor(headers, content))
-        return _do_vimeo_call
+                    response = future.result()
+                except VimeoAPIError as e:
+                    response = e
+                for index in indexes:
+                    responses[index] = response
+
+        try:
+            make(others)
+            remaining = []
+            for name, params, process, indexes in lookups:
+                stored = self._stored(name, params, process)
+                if stored is MISSING:
+                    remaining.append((name, params, process, indexes))
+                    continue
+                for index in indexes:
+                    responses[index] = stored
+            make(remaining)
+        finally:
+            workers.shutdown()
+        return responses
+
+    def iter_pages(self, name, prefetch=2, fan_out=False, **params):
+        """
+        Iterates over the items of a paginated listing, like
+        videos_getUploaded or channels_getVideos, starting at the page
+        parameter (1 by default) and going on until the last page.
+
+        Items are dicts with the json format and elements with the xml
+        format, even for pages holding a single item.
+
+        While the items of a page are consumed, the next prefetch pages (at
+        least one) are fetched in the background. With fan_out, all the
+        remaining pages are fetched as soon as the first one tells how many
+        there are, with prefetch concurrent requests.
+
+        An empty page ends the listing.
+        """
+        name = self._full_name(name)
+        page = int(params.pop("page", None) or 1)
+        params.pop("process", None)
+        workers = WorkerPool(max(prefetch, 1))
+        upcoming = deque()
+        try:
+            items, per_page, total = _listing_page(
+                                        self.call(name, page=page, **params))
+            if per_page and total is not None:
+                last_page = (total + per_page - 1) // per_page
+            else:
+                # no idea how many there are, stop at the first short (or
+                # empty) page
+                last_page = None
+
+            while True:
+                if fan_out and last_page is not None:
+                    ahead = last_page - page
+                else:
+                    ahead = max(prefetch, 1)
+                next_page = page + len(upcoming) + 1
+                while (len(upcoming) < ahead and
+                       (last_page is None or next_page <= last_page)):
+                    upcoming.append(workers.submit(self.call, name,
+                                                   page=next_page, **params))
+                    next_page += 1
+
+                for item in items:
+                    yield item
+
+                if not upcoming or not items or (last_page is None and
+                                                 len(items) < per_page):
+                    return
+                items = _listing_page(upcoming.popleft().result())[0]
+                page += 1
+        finally:
+            for future in upcoming:
+                future.cancel()
+            workers.shutdown()
+
+    def stream(self, name, **params):
+        """
+        Iterates over the items of a listing as its response is downloaded,
+        for listings too large to hold in memory at once (e.g. with
+        full_response and a large per_page). Only the json and xml formats
+        are supported, and the cache is bypassed. See the iter_items methods
+        of JSONProcessor and XMLProcessor.
+
+        If an info dict is given, the other values of the listing (page,
+        perpage, total...) are put in it.
+        """
+        import requests
+
+        info = params.pop("info", None)
+        params, _ = self._prepare(params)
+        params["method"] = self._full_name(name).replace("_", ".")
+        processor = self._processors.get(params["format"].upper())
+        if not hasattr(processor, "iter_items"):
+            raise VimeoError("Can't stream the {0} format.".format(
+                                                            params["format"]))
+
+        request = oauth2.Request.from_consumer_and_token(
+                                          consumer=self.consumer,
+                                          token=self.token,
+                                          http_method="GET",
+                                          http_url=API_REST_URL,
+                                          parameters=params)
+        request.sign_request(self.signature_method, self.consumer,
+                             self.token)
+
+        response = requests.get(request.to_url(), stream=True,
+                                headers=self._CLIENT_HEADERS)
+        try:
+            response.raw.decode_content = True
+            for item in processor.iter_items(response.raw, info):
+                yield item
+        finally:
+            response.close()
+
+    def _full_name(self, name):
+        if not name.startswith("vimeo"):
+            name = "vimeo_" + name
+        return name
+
+    def _fetch(self, key, api_method, params):
+        name = key[0]
+        started = time.time()
+        response = self._request(api_method, params)
+        try:
+            # processed once here, hits reuse it
+            processed = response.process(self._processor(params["format"]))
+        except VimeoAPIError as e:
+            # the caller gets the error when processing, which hits of the
+            # cached error do as well
+            ttl = self.error_ttls.get(str(e.error_code), self.error_ttl)
+            if ttl > 0:
+                response.fresh_until = response.fetched_at + ttl
+                self._cache.put(key, response, size=len(response.content),
+                                timeout=ttl)
+                if not self._dependencies.add(key, param_refs(params),
+                                              started, ttl):
+                    self._cache.delete(key)
+            return response
+        except Exception:
+            # not something the processor understands (like an error page):
+            # not cached, and returned as is to callers not processing it
+            return response
+
+        self.ttl_policy.fetched(name, key, response.content,
+                                self._cache.timeout)
+        ttl = self.ttl_policy.ttl(name, self._cache.timeout)
+        response.fresh_until = response.fetched_at + ttl
+        # kept until the end of its stale window
+        keep = ttl + self.stale_ttl if ttl > 0 else ttl
+        self._cache.put(key, response, size=len(response.content),
+                        timeout=keep)
+        refs = param_refs(params) | content_refs(processed)
+        if not self._dependencies.add(key, refs, started, keep):
+            # written to while we were waiting for the response
+            self._cache.delete(key)
+        else:
+            self._store_entities(name, params, processed, ttl)
+
+        if (self.cache_file is not None and self.cache_save_interval and
+            time.time() - self._saved_at >= self.cache_save_interval):
+            self._saved_at = time.time()
+            self._refresher.submit(self.save_cache)
+        return response
+
+    def _write(self, api_method, params):
+        """
+        Makes a call that changes something and, if it succeeds, drops the
+        cached responses mentioning the entities it was given.
+        """
+        response = self._request(api_method, params)
+        try:
+            response.process(self._processor(params["format"]))
+        except VimeoAPIError:
+            return response
+        except Exception:
+            # can't tell whether it succeeded, invalidate in case it did
+            pass
+        refs = param_refs(params)
+        for key in self._dependencies.invalidate(refs):
+            self._cache.delete(key)
+        for ref in refs:
+            self._entities.delete(ref)
+        return response
+
+    def _request(self, api_method, params):
+        """
+        Calls the API, bypassing the cache. Returns a CachedResponse.
+        """
+        # change these after we memoize, before calling the API
+        params = dict(params, method=api_method)
+
+        request_uri = "{api_url}?&{params}".format(api_url=API_REST_URL,
+                                                  params=urlencode(params))
+        with self._connections.connection() as connection:
+            headers, content = connection.request(uri=request_uri,
+                                                headers=self._CLIENT_HEADERS)
+        return CachedResponse(headers, content)
 
     def __repr__(self):
         tokened = "T" if self.token else "Unt"
@@ -379,15 +1157,80 @@ class VimeoClient(object):
 
     default_response_format = property(_get_default_response_format, _set_default_response_format)
 
+    def _get_cache_timeout(self):
+        """
+        Number of seconds API responses are cached for. Changing it only
+        affects responses cached afterwards.
+        """
+        return self._cache.timeout
+
+    def _set_cache_timeout(self, value):
+        self._cache.timeout = self._entities.timeout = value
+
+    cache_timeout = property(_get_cache_timeout, _set_cache_timeout)
+
+    def set_processor(self, format, processor):
+        """
+        Sets the processor used for responses in the given format, e.g. to
+        use another json module:
+
+            client.set_processor("json", JSONProcessor(json="simplejson"))
+
+        The processor is called with the headers and content of each
+        response and may be called from several threads at once.
+        """
+        self._processors[format.upper()] = processor
+
     def _no_processing(self, response_headers, response_content):
         return response_headers, response_content
 
+    def load_cache(self, path=None):
+        """
+        Loads the responses saved in path (the cache_file by default) that
+        haven't expired into the cache. A file that can't be read is
+        ignored.
+
+        The loaded responses are dropped by writes to the entities named by
+        their parameters, like the ones fetched by the client.
+        """
+        path = path or self.cache_file
+        try:
+            saved_at = os.path.getmtime(path)
+            loaded = self._cache.load(path)
+        except (EnvironmentError, ValueError) as e:
+            if LOG:
+                logging.warning("Can't load the cache from {0}: {1}".format(
+                                                                    path, e))
+            return
+        now = time.time()
+        for key, expires in loaded:
+            # anything written to since the snapshot was saved is stale
+            if not self._dependencies.add(key, param_refs(dict(key[1])),
+                                          saved_at, expires - now):
+                self._cache.delete(key)
+
+    def save_cache(self, path=None):
+        """
+        Saves the cache to path (the cache_file by default).
+        """
+        with self._saving:
+            self._saved_at = time.time()
+            self._cache.save(path or self.cache_file)
+
+    def cache_stats(self):
+        """
+        Returns the cache statistics of each API method called so far, see
+        vimeo.cache.TTLPolicy.stats.
+        """
+        return self.ttl_policy.stats()
+
     def flush_cache(self):
         """
         Manually clear the response cache.
         """
-        self._cache = {}
-        self._timeouts = {}
+        self._cache.clear()
+        self._dependencies.clear()
+        self._entities.clear()
 
     # ---- 3-legged oAuth ----
     def _is_success(self, headers):
@@ -413,6 +1256,7 @@ class VimeoClient(object):
             self.token = oauth2.Token(new_token["oauth_token"],
                                       new_token["oauth_token_secret"])
             self.client = oauth2.Client(self.consumer, self.token)
+            self._connections.clear()
 
     def get_request_token(self):
         """
@@ -447,6 +1291,7 @@ class VimeoClient(object):
             raise VimeoError("No request token present.")
         self.token.set_verifier(verifier)
         self.client = oauth2.Client(self.consumer, self.token)
+        self._connections.clear()
 
     def get_access_token(self):
         """
@@ -468,7 +1313,9 @@ class VimeoClient(object):
     def get_uploader(self, *args, **kwargs):
         """
         Returns a VimeoUploader object that is instantiated with the quota for
-        this client's oauth_token and a new ticket.
+        this client's oauth_token and a new ticket, or with the ticket of the
+        upload recorded in the journal keyword argument if there is one, to
+        resume it.
 
         (Because this module isn't meant to assume any particularly rigid API
         behavior, this method and the VimeoUploader class are merely convenient
@@ -477,7 +1324,98 @@ class VimeoClient(object):
         """
         from convenience import VimeoUploader
 
-        quota = self.vimeo_videos_upload_getQuota(format="json")
-        ticket = self.vimeo_videos_upload_getTicket(format="json")
+        quota = self.call("vimeo_videos_upload_getQuota", format="json")
+        if kwargs.get("journal") is not None:
+            uploader = VimeoUploader.resume(self, quota=quota, *args,
+                                            **kwargs)
+            if uploader is not None:
+                return uploader
+        ticket = self.call("vimeo_videos_upload_getTicket", format="json")
         return VimeoUploader(vimeo_client=self, ticket=ticket, quota=quota,
                              *args, **kwargs)
+
+
+# clients with a cache_file, saved at exit
+_saved_clients = weakref.WeakSet()
+
+@atexit.register
+def _save_caches():
+    for client in list(_saved_clients):
+        try:
+            client.save_cache()
+        except EnvironmentError as e:
+            if LOG:
+                logging.warning("Can't save the cache to {0}: {1}".format(
+                                                        client.cache_file, e))
+
+
+def _listing_page(response):
+    """
+    Returns the items of a processed listing page in a list, the number of
+    items per page and the total number of items (or None if unknown).
+    """
+    if hasattr(response, "attrib"):
+        # xml: <videos page="1" perpage="50" total="..."><video .../>...
+        items, info = list(response), response.attrib
+    else:
+        # json: {"page" : "1", "perpage" : "50", ..., "video" : [...]}, or a
+        # single dict (or view) instead of the list if there is only one item
+        items, info = [], response
+        for value in response.itervalues():
+            if isinstance(value, list):
+                items = value
+            elif isinstance(value, (dict, Entity)):
+                items = [value]
+
+    per_page = int(info.get("perpage") or len(items))
+    total = info.get("total")
+    return items, per_page, int(total) if total is not None else None
+
+
+class AsyncVimeoClient(VimeoClient):
+    """
+    A VimeoClient whose API methods don't wait for the response.
+
+    They return a vimeo.concurrency.Future right away instead; its result()
+    method waits for and returns the response (or raises the API error).
+    Responses are processed and cached the same way as with VimeoClient,
+    and cached responses come back as already completed futures.
+
+    At most concurrency calls are made at the same time, the others are
+    queued and can still be cancelled with the future's cancel() method.
+    The calls run on a pool of worker threads, each using its own
+    connection.
+    """
+    def __init__(self, *args, **kwargs):
+        concurrency = kwargs.pop("concurrency", 8)
+        kwargs.setdefault("pool_size", concurrency)
+        super(AsyncVimeoClient, self).__init__(*args, **kwargs)
+        self._workers = WorkerPool(concurrency)
+
+    def __repr__(self):
+        return "<Async" + super(AsyncVimeoClient, self).__repr__()[1:]
+
+    def _dispatch(self, name, api_method, params):
+        params, process = self._prepare(params)
+        if self._cacheable(name):
+            try:
+                cached = self._cached(name, self._cache_key(name, params),
+                                      params, process)
+            except VimeoAPIError:
+                future = Future()
+                future.set_exception(sys.exc_info())
+                return future
+            if cached is not MISSING:
+                future = Future()
+                future.set_result(cached)
+                return future
+        params["process"] = process
+        return self._workers.submit(self._call, name, api_method, params)
+
+
+# real methods for the catalogued API methods, with and without the vimeo_
+for _name in API_METHODS:
+    _method = make_api_method(_name)
+    setattr(VimeoClient, _name, _method)
+    setattr(VimeoClient, _name[len("vimeo_"):], _method)
+del _name, _method
@@ -0,0 +1,874 @@
+# Copyright 2010 Julian Berman
+# The MIT License
+#
+# Copyright (c) 2010
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+Response caches used by VimeoClient to memoize API calls.
+
+MemoryCache is private to a client, while SQLiteCache and MmapCache keep
+their entries in a file so that several processes (forked workers, cron
+jobs...) can share them.
+"""
+import cPickle as pickle
+import fnmatch
+import hashlib
+import heapq
+import itertools
+import mmap
+import os
+import re
+import sqlite3
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+from .models import Entity
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# sentinel for cache misses, since None is a perfectly good cached response
+MISSING = object()
+
+
+class CachedResponse(object):
+    """
+    The raw headers and content of an API response, as cached by the
+    client.
+
+    The processed form is derived from the content on demand and memoized,
+    so calls asking for the raw response and calls asking for the processed
+    one share the same cache entry. Only the raw response is pickled.
+
+    fetched_at is the time the response was received and fresh_until the
+    time it goes stale (None if it never does), which may be before the
+    cache drops it.
+    """
+    __slots__ = ("headers", "content", "fetched_at", "fresh_until",
+                 "_processed")
+
+    def __init__(self, headers, content, fetched_at=None, fresh_until=None):
+        self.headers = headers
+        self.content = content
+        if fetched_at is None:
+            fetched_at = time.time()
+        self.fetched_at = fetched_at
+        self.fresh_until = fresh_until
+        # (processor, processed content) of the last processing
+        self._processed = None
+
+    def __getstate__(self):
+        return self.headers, self.content, self.fetched_at, self.fresh_until
+
+    def __setstate__(self, state):
+        if len(state) == 2:
+            # pickled before fetched_at and fresh_until existed
+            state += (0, None)
+        self.headers, self.content, self.fetched_at, self.fresh_until = state
+        self._processed = None
+
+    def process(self, processor):
+        """
+        Returns the content processed by processor, processing it only the
+        first time.
+        """
+        processed = self._processed
+        if processed is not None and processed[0] is processor:
+            return processed[1]
+        content = processor(self.headers, self.content)
+        self._processed = (processor, content)
+        return content
+
+
+def key_digest(key):
+    """
+    Returns a stable SHA-1 digest of a client cache key, for backends that
+    can't store the key itself.
+    """
+    name, params = key
+    return hashlib.sha1(repr((name, sorted(params)))).digest()
+
+
+class BaseCache(object):
+    """
+    Interface for response cache backends.
+
+    Backends store values for a limited time: put takes a timeout in seconds
+    and falls back to the backend's timeout attribute if it isn't given. A
+    timeout that isn't positive means the value is not stored at all.
+    """
+    timeout = 120
+
+    def get(self, key, default=None):
+        """
+        Returns the cached value for key, or default if it is missing or
+        expired.
+        """
+        raise NotImplementedError
+
+    def put(self, key, value, size=0, timeout=None):
+        """
+        Stores value under key and returns it. size is the size of the
+        response the value came from, for backends that limit their size.
+        """
+        raise NotImplementedError
+
+    def delete(self, key):
+        """
+        Removes key from the cache if it is present.
+        """
+        raise NotImplementedError
+
+    def clear(self):
+        """
+        Removes every entry from the cache.
+        """
+        raise NotImplementedError
+
+
+class MemoryCache(BaseCache):
+    """
+    Bounded in-process LRU cache with per-entry expiry.
+
+    Lookups and stores are O(1) (plus O(log n) to schedule the expiry).
+    Expired entries are dropped lazily, either when they are looked up or
+    when they reach the top of the expiry heap, so there is never a sweep
+    over the whole cache.
+
+    When either max_entries or max_bytes (the sum of the sizes given to put)
+    is exceeded, the least recently used entries are evicted. A limit of None
+    means unbounded.
+
+    The cache is safe to share between threads; every operation holds a
+    lock for a short, constant time.
+
+    save writes the entries to a snapshot file that load reads back, e.g.
+    in the next run of a program, keeping their expiry times. Loading only
+    reads the snapshot's index: the values are unpickled from the mapped
+    file the first time they are looked up.
+    """
+    _SNAPSHOT_MAGIC = "VIMEOMC1"
+    # magic, offset and length of the index
+    _SNAPSHOT_HEADER = struct.Struct("<8sQQ")
+
+    def __init__(self, timeout=120, max_entries=None, max_bytes=None):
+        self.timeout = timeout
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return self.get(key, MISSING) is not MISSING
+
+    def clear(self):
+        """
+        Removes every entry from the cache.
+        """
+        with self._lock:
+            # key -> (value, expires, size), least recently used first
+            self._entries = OrderedDict()
+            # heap of (expires, tiebreaker, key), may hold stale items
+            self._expiry = []
+            self.size = 0
+
+    def get(self, key, default=None):
+        """
+        Returns the cached value for key, or default if it is missing or
+        expired. A hit marks the entry as most recently used.
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return default
+            if entry[1] <= time.time():
+                self.size -= entry[2]
+                return default
+            if isinstance(entry[0], _Snapshotted):
+                try:
+                    entry = (entry[0].load(),) + entry[1:]
+                except Exception:
+                    self.size -= entry[2]
+                    return default
+            self._entries[key] = entry
+            return entry[0]
+
+    def put(self, key, value, size=0, timeout=None):
+        """
+        Stores value under key for timeout seconds (defaults to the cache's
+        timeout) and returns it. Nothing is stored if the timeout is not
+        positive or if size alone is over max_bytes.
+        """
+        if timeout is None:
+            timeout = self.timeout
+        if timeout <= 0 or (self.max_bytes is not None and
+                            size > self.max_bytes):
+            return value
+
+        with self._lock:
+            now = time.time()
+            self._delete(key)
+            expires = now + timeout
+            self._entries[key] = (value, expires, size)
+            self.size += size
+            heapq.heappush(self._expiry, (expires, next(self._counter), key))
+
+            self._expire(now)
+            self._evict()
+        return value
+
+    def delete(self, key):
+        """
+        Removes key from the cache if it is present.
+        """
+        with self._lock:
+            self._delete(key)
+
+    def save(self, path):
+        """
+        Writes the entries that haven't expired to a snapshot file at path,
+        replacing it at once. Values that can't be pickled are left out.
+        """
+        with self._lock:
+            now = time.time()
+            entries = [(key, entry) for key, entry in self._entries.iteritems()
+                       if entry[1] > now]
+
+        header = self._SNAPSHOT_HEADER
+        index = []
+        partial = "{0}.{1}.tmp".format(path, os.getpid())
+        with open(partial, "wb") as snapshot:
+            snapshot.write(header.pack(self._SNAPSHOT_MAGIC, 0, 0))
+            offset = header.size
+            for key, (value, expires, size) in entries:
+                if isinstance(value, _Snapshotted):
+                    data = value.data()
+                else:
+                    try:
+                        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+                    except (pickle.PicklingError, TypeError):
+                        continue
+                snapshot.write(data)
+                index.append((key, expires, size, offset, len(data)))
+                offset += len(data)
+            data = pickle.dumps(index, pickle.HIGHEST_PROTOCOL)
+            snapshot.write(data)
+            snapshot.seek(0)
+            snapshot.write(header.pack(self._SNAPSHOT_MAGIC, offset,
+                                       len(data)))
+        os.rename(partial, path)
+
+    def load(self, path):
+        """
+        Adds the entries of the snapshot file at path that haven't expired
+        and aren't in the cache already, and returns the (key, expires)
+        pairs of those that were added. Raises ValueError if the file isn't
+        a snapshot.
+        """
+        with open(path, "rb") as snapshot:
+            try:
+                map = mmap.mmap(snapshot.fileno(), 0, access=mmap.ACCESS_READ)
+            except (mmap.error, ValueError):
+                raise ValueError("{0} is not a cache snapshot.".format(path))
+        try:
+            magic, offset, length = self._SNAPSHOT_HEADER.unpack_from(map)
+            if magic != self._SNAPSHOT_MAGIC:
+                raise ValueError
+            index = pickle.loads(map[offset:offset + length])
+        except Exception:
+            map.close()
+            raise ValueError("{0} is not a cache snapshot.".format(path))
+
+        added = []
+        with self._lock:
+            now = time.time()
+            for key, expires, size, offset, length in index:
+                if expires <= now or key in self._entries:
+                    continue
+                self._entries[key] = (_Snapshotted(map, offset, length),
+                                      expires, size)
+                self.size += size
+                heapq.heappush(self._expiry,
+                               (expires, next(self._counter), key))
+                added.append((key, expires))
+            self._expire(now)
+            self._evict()
+        return added
+
+    # the methods below expect the lock to be held
+
+    def _delete(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[2]
+
+    def _expire(self, now):
+        expiry = self._expiry
+        while expiry and expiry[0][0] <= now:
+            expires, _, key = heapq.heappop(expiry)
+            entry = self._entries.get(key)
+            # skip heap items left behind by a later put of the same key
+            if entry is not None and entry[1] == expires:
+                self._delete(key)
+
+        # evicted and overwritten keys leave stale heap items behind, rebuild
+        # the heap once they outnumber the live entries
+        if len(expiry) > 2 * len(self._entries) + 64:
+            self._expiry = [(entry[1], next(self._counter), key)
+                            for key, entry in self._entries.iteritems()]
+            heapq.heapify(self._expiry)
+
+    def _evict(self):
+        entries = self._entries
+        while entries and (
+                (self.max_entries is not None and
+                 len(entries) > self.max_entries) or
+                (self.max_bytes is not None and self.size > self.max_bytes)):
+            _, entry = entries.popitem(last=False)
+            self.size -= entry[2]
+
+
+class _Snapshotted(object):
+    """
+    A value of a MemoryCache snapshot, still pickled in the mapped file.
+    """
+    __slots__ = ("map", "offset", "length")
+
+    def __init__(self, map, offset, length):
+        self.map = map
+        self.offset = offset
+        self.length = length
+
+    def data(self):
+        return self.map[self.offset:self.offset + self.length]
+
+    def load(self):
+        return pickle.loads(self.data())
+
+
+class SQLiteCache(BaseCache):
+    """
+    Cache stored in an SQLite database, shared by every process using the
+    same path.
+
+    Values are pickled, so responses that can't be pickled (like lxml
+    trees) are simply not cached. When max_entries is set, the entries
+    closest to expiry are dropped first to make room.
+    """
+    _PURGE_EVERY = 128
+
+    def __init__(self, path, timeout=120, max_entries=None):
+        self.path = path
+        self.timeout = timeout
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._puts = 0
+
+        conn = self._connection()
+        conn.execute("CREATE TABLE IF NOT EXISTS responses ("
+                     "key BLOB PRIMARY KEY, value BLOB NOT NULL, "
+                     "expires REAL NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS responses_expires "
+                     "ON responses (expires)")
+
+    def _connection(self):
+        # sqlite connections can't be shared between threads, nor survive a
+        # fork, so each thread of each process gets its own
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30,
+                                   isolation_level=None)
+            try:
+                conn.execute("PRAGMA journal_mode=WAL")
+            except sqlite3.DatabaseError:
+                pass
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def get(self, key, default=None):
+        row = self._connection().execute(
+                    "SELECT value, expires FROM responses WHERE key = ?",
+                    (sqlite3.Binary(key_digest(key)),)).fetchone()
+        if row is None or row[1] <= time.time():
+            return default
+        return pickle.loads(str(row[0]))
+
+    def put(self, key, value, size=0, timeout=None):
+        if timeout is None:
+            timeout = self.timeout
+        if timeout <= 0:
+            return value
+        try:
+            data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, TypeError):
+            return value
+
+        now = time.time()
+        conn = self._connection()
+        conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?)",
+                     (sqlite3.Binary(key_digest(key)), sqlite3.Binary(data),
+                      now + timeout))
+
+        self._puts += 1
+        if self._puts % self._PURGE_EVERY == 0:
+            conn.execute("DELETE FROM responses WHERE expires <= ?", (now,))
+            if self.max_entries is not None:
+                conn.execute("DELETE FROM responses WHERE key IN ("
+                             "SELECT key FROM responses ORDER BY expires "
+                             "LIMIT max(0, (SELECT count(*) FROM responses)"
+                             " - ?))", (self.max_entries,))
+        return value
+
+    def delete(self, key):
+        self._connection().execute("DELETE FROM responses WHERE key = ?",
+                                   (sqlite3.Binary(key_digest(key)),))
+
+    def clear(self):
+        self._connection().execute("DELETE FROM responses")
+
+
+class MmapCache(BaseCache):
+    """
+    Cache stored in a memory-mapped file, shared by every process using the
+    same path.
+
+    The file is split into a fixed number of fixed size slots and each key
+    always maps to the same slot, so storing a key overwrites whatever other
+    key was using its slot. Values are pickled and those that don't fit in
+    a slot are not cached. Access from several processes is serialized with
+    flock where it is available.
+    """
+    # key digest, expiry time, length of the pickled value
+    _HEADER = struct.Struct("<20sdI")
+
+    def __init__(self, path, timeout=120, slots=4096, slot_size=64 * 1024):
+        if slot_size <= self._HEADER.size:
+            raise ValueError("slot_size is too small.")
+        self.path = path
+        self.timeout = timeout
+        self.slots = slots
+        self.slot_size = slot_size
+        self._lock = threading.Lock()
+        self._pid = None
+        self._open()
+
+    def _open(self):
+        length = self.slots * self.slot_size
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0600)
+        try:
+            if os.fstat(fd).st_size < length:
+                os.ftruncate(fd, length)
+            self._file = os.fdopen(fd, "r+b")
+        except:
+            os.close(fd)
+            raise
+        self._map = mmap.mmap(self._file.fileno(), length)
+        self._pid = os.getpid()
+
+    def _locked(self, operation, exclusive=False):
+        with self._lock:
+            # flock locks are shared with the parent after a fork, reopen
+            if self._pid != os.getpid():
+                self._open()
+            if fcntl is None:
+                return operation()
+            fd = self._file.fileno()
+            fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                return operation()
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def _slot(self, digest):
+        return (struct.unpack_from("<Q", digest)[0] % self.slots *
+                self.slot_size)
+
+    def get(self, key, default=None):
+        digest = key_digest(key)
+        offset = self._slot(digest)
+
+        def read():
+            stored, expires, length = self._HEADER.unpack_from(self._map,
+                                                               offset)
+            if stored != digest or expires <= time.time():
+                return None
+            start = offset + self._HEADER.size
+            return self._map[start:start + length]
+
+        data = self._locked(read)
+        if data is None:
+            return default
+        return pickle.loads(data)
+
+    def put(self, key, value, size=0, timeout=None):
+        if timeout is None:
+            timeout = self.timeout
+        if timeout <= 0:
+            return value
+        try:
+            data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, TypeError):
+            return value
+        if self._HEADER.size + len(data) > self.slot_size:
+            return value
+
+        digest = key_digest(key)
+        offset = self._slot(digest)
+
+        def write():
+            start = offset + self._HEADER.size
+            self._map[start:start + len(data)] = data
+            self._HEADER.pack_into(self._map, offset, digest,
+                                   time.time() + timeout, len(data))
+
+        self._locked(write, exclusive=True)
+        return value
+
+    def delete(self, key):
+        digest = key_digest(key)
+        offset = self._slot(digest)
+
+        def clear_slot():
+            if self._HEADER.unpack_from(self._map, offset)[0] == digest:
+                self._HEADER.pack_into(self._map, offset, "", 0, 0)
+
+        self._locked(clear_slot, exclusive=True)
+
+    def clear(self):
+        def clear_slots():
+            for offset in xrange(0, self.slots * self.slot_size,
+                                 self.slot_size):
+                self._HEADER.pack_into(self._map, offset, "", 0, 0)
+
+        self._locked(clear_slots, exclusive=True)
+
+    def close(self):
+        """
+        Unmaps and closes the cache file.
+        """
+        with self._lock:
+            self._map.close()
+            self._file.close()
+
+
+# parameters naming an entity -> its type
+PARAM_ENTITIES = {"album_id" : "album",
+                  "channel_id" : "channel",
+                  "group_id" : "group",
+                  "user_id" : "user",
+                  "video_id" : "video"}
+
+# keys (or xml tags) entities are found under in responses -> their type
+CONTENT_ENTITIES = {"album" : "album",
+                    "channel" : "channel",
+                    "group" : "group",
+                    "video" : "video"}
+
+
+def param_refs(params):
+    """
+    Returns the set of (type, id) entities named by the parameters of a
+    call, e.g. ("video", "1234") for video_id=1234.
+    """
+    refs = set()
+    for param, value in params.iteritems():
+        kind = PARAM_ENTITIES.get(param)
+        if kind is not None and value is not None:
+            refs.update((kind, id.strip()) for id in str(value).split(","))
+    return refs
+
+
+def content_refs(content):
+    """
+    Returns the set of (type, id) entities found in a processed response,
+    e.g. the videos of an album_getVideos listing.
+    """
+    refs = set()
+    if hasattr(content, "iter"):
+        # xml
+        for element in content.iter():
+            kind = CONTENT_ENTITIES.get(element.tag)
+            if kind is not None and "id" in element.attrib:
+                refs.add((kind, element.attrib["id"]))
+        return refs
+
+    def walk(value, kind):
+        if isinstance(value, list):
+            for item in value:
+                walk(item, kind)
+        elif isinstance(value, dict):
+            if kind is not None and "id" in value:
+                refs.add((kind, str(value["id"])))
+            for name, item in value.iteritems():
+                if isinstance(item, (list, dict, Entity)):
+                    walk(item, CONTENT_ENTITIES.get(name))
+        elif isinstance(value, Entity) and kind is not None:
+            id = value.get("id")
+            if id is not None:
+                refs.add((kind, str(id)))
+    walk(content, None)
+    return refs
+
+
+class DependencyIndex(object):
+    """
+    Maps the entities (videos, albums, channels, groups and users) that
+    cached responses mention to their cache keys, so that a write to an
+    entity can invalidate exactly the responses it makes stale.
+
+    Keys are forgotten when invalidated or once older than the max_age
+    given to add, which should be how long the cache keeps them.
+    The index lives in the client's process: with a cache shared between
+    processes, only the responses cached by this process are invalidated.
+    """
+    _PRUNE_EVERY = 1024
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def clear(self):
+        with self._lock:
+            # (type, id) -> set of keys
+            self._refs = {}
+            # key -> (refs, time it expires)
+            self._keys = {}
+            # (type, id) -> time of its last invalidation
+            self._invalidated = {}
+            self._added = 0
+            self._max_age = 0
+
+    def add(self, key, refs, since, max_age):
+        """
+        Records that the response cached under key mentions refs. since is
+        the time its request was started: if one of the entities was
+        invalidated since then, the response may already be stale and False
+        is returned, in which case it shouldn't be cached.
+        """
+        with self._lock:
+            invalidated = self._invalidated
+            if any(invalidated.get(ref, 0) >= since for ref in refs):
+                return False
+            self._discard(key)
+            now = time.time()
+            self._keys[key] = (refs, now + max_age)
+            self._max_age = max(self._max_age, max_age)
+            for ref in refs:
+                self._refs.setdefault(ref, set()).add(key)
+
+            self._added += 1
+            if self._added >= self._PRUNE_EVERY + len(self._keys) // 2:
+                self._prune(now)
+            return True
+
+    def invalidate(self, refs):
+        """
+        Forgets the keys of the responses mentioning refs and returns them.
+        """
+        keys = set()
+        with self._lock:
+            now = time.time()
+            for ref in refs:
+                self._invalidated[ref] = now
+                keys.update(self._refs.pop(ref, ()))
+            for key in keys:
+                self._discard(key)
+        return keys
+
+    # the methods below expect the lock to be held
+
+    def _discard(self, key):
+        refs, _ = self._keys.pop(key, ((), None))
+        for ref in refs:
+            keys = self._refs.get(ref)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._refs[ref]
+
+    def _prune(self, now):
+        self._added = 0
+        for key, (_, expires) in self._keys.items():
+            if expires < now:
+                self._discard(key)
+        for ref, invalidated in self._invalidated.items():
+            if invalidated < now - self._max_age:
+                del self._invalidated[ref]
+
+
+# generated_in changes with every response, even when nothing else does
+_GENERATED_IN = re.compile(r'generated_in(?:="[^"]*"|"\s*:\s*"[^"]*")')
+
+def content_digest(content):
+    """
+    Returns a digest of the content of a response telling whether it
+    changed from another response, ignoring its generated_in time.
+    """
+    return hashlib.sha1(_GENERATED_IN.sub("", content)).digest()
+
+
+class TTLPolicy(object):
+    """
+    Decides how long the responses of each API method are cached for, and
+    keeps hit and miss statistics per method.
+
+    rules is a sequence of (pattern, ttl) pairs, the pattern matching method
+    names given like for VimeoClient.call ("channels_getInfo",
+    "activity_*"), and the first matching rule wins. A ttl of 0 means the
+    method is never cached. Methods matching no rule are cached for the
+    default ttl given to the ttl method (the client's cache_timeout).
+
+    When adaptive, the ttl of each method matching no rule is tuned from
+    how often a response fetched again once its cached copy expired turns
+    out to have changed: each unchanged refresh lengthens it by step and
+    each changed one shortens it, so that about target_changed of the
+    refreshes see a change. The ttl stays between min_ttl and max_ttl, and
+    the digests of at most max_keys responses are kept to compare with.
+    """
+    def __init__(self, rules=(), adaptive=False, min_ttl=5, max_ttl=86400,
+                 target_changed=0.1, step=0.1, max_keys=100000):
+        self.rules = [(pattern if pattern.startswith("vimeo")
+                       else "vimeo_" + pattern, ttl)
+                      for pattern, ttl in rules]
+        self.adaptive = adaptive
+        self.min_ttl = min_ttl
+        self.max_ttl = max_ttl
+        self.max_keys = max_keys
+        self._grow = 1 + step
+        # shrinking by this much on a change balances 1 / target_changed - 1
+        # unchanged refreshes
+        self._shrink = self._grow ** -((1 - target_changed) / target_changed)
+        self._lock = threading.Lock()
+        # method name -> ttl of its rule (None if there's none)
+        self._rules = {}
+        # method name -> tuned ttl
+        self._ttls = {}
+        # key -> digest of its last response
+        self._digests = OrderedDict()
+        # method name -> [hits, misses, refreshes, changed, stale]
+        self._stats = {}
+
+    def rule(self, name):
+        """
+        Returns the ttl of the first rule matching the method name (e.g.
+        vimeo_videos_getInfo), or None.
+        """
+        try:
+            return self._rules[name]
+        except KeyError:
+            for pattern, ttl in self.rules:
+                if fnmatch.fnmatchcase(name, pattern):
+                    break
+            else:
+                ttl = None
+            self._rules[name] = ttl
+            return ttl
+
+    def ttl(self, name, default):
+        """
+        Returns how long to cache a response of the method name for.
+        """
+        ttl = self.rule(name)
+        if ttl is not None:
+            return ttl
+        if self.adaptive:
+            return self._ttls.get(name, default)
+        return default
+
+    def hit(self, name, stale=False):
+        with self._lock:
+            stats = self._method_stats(name)
+            stats[0] += 1
+            if stale:
+                stats[4] += 1
+
+    def miss(self, name):
+        with self._lock:
+            self._method_stats(name)[1] += 1
+
+    def fetched(self, name, key, content, default):
+        """
+        Records the content of a response fetched for key, counting it as a
+        refresh if a response was fetched for key before, and tunes the
+        method's ttl.
+        """
+        digest = content_digest(content)
+        with self._lock:
+            previous = self._digests.pop(key, None)
+            self._digests[key] = digest
+            if len(self._digests) > self.max_keys:
+                self._digests.popitem(last=False)
+            if previous is None:
+                return
+            stats = self._method_stats(name)
+            stats[2] += 1
+            changed = previous != digest
+            if changed:
+                stats[3] += 1
+
+            if self.adaptive and self.rule(name) is None:
+                ttl = self._ttls.get(name, default)
+                ttl *= self._shrink if changed else self._grow
+                self._ttls[name] = min(max(ttl, self.min_ttl), self.max_ttl)
+
+    def stats(self):
+        """
+        Returns a dict mapping method names to dicts of their hits, misses,
+        refreshes (fetches of responses fetched before), changed (refreshes
+        that got a different response) and stale (hits served stale) counts,
+        along with their tuned ttl when adaptive.
+        """
+        with self._lock:
+            stats = {}
+            for name, (hits, misses, refreshes, changed, stale) in \
+                    self._stats.iteritems():
+                stats[name] = {"hits" : hits, "misses" : misses,
+                               "refreshes" : refreshes, "changed" : changed,
+                               "stale" : stale}
+                if name in self._ttls:
+                    stats[name]["ttl"] = self._ttls[name]
+            return stats
+
+    def clear(self):
+        """
+        Forgets the statistics, the tuned ttls and the response digests.
+        """
+        with self._lock:
+            self._ttls.clear()
+            self._digests.clear()
+            self._stats.clear()
+
+    def _method_stats(self, name):
+        stats = self._stats.get(name)
+        if stats is None:
+            stats = self._stats[name] = [0, 0, 0, 0, 0]
+        return stats
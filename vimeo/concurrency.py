@@ -0,0 +1,320 @@
+# Copyright 2010 Julian Berman
+# The MIT License
+#
+# Copyright (c) 2010
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+Threading helpers used by VimeoClient.
+"""
+import Queue
+import atexit
+import sys
+import threading
+import weakref
+from contextlib import contextmanager
+
+
+class CancelledError(Exception):
+    """
+    Exception raised when getting the result of a cancelled call.
+    """
+    pass
+
+class TimeoutError(Exception):
+    """
+    Exception raised when a call doesn't complete in the given time.
+    """
+    pass
+
+
+class Future(object):
+    """
+    The outcome of a call that may still be running in another thread.
+    """
+    _PENDING, _RUNNING, _CANCELLED, _FINISHED = range(4)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._state = self._PENDING
+        self._result = None
+        self._exc_info = None
+        self._callbacks = []
+
+    def done(self):
+        return self._done.is_set()
+
+    def cancelled(self):
+        return self._state == self._CANCELLED
+
+    def cancel(self):
+        """
+        Cancels the call if it hasn't started yet. Returns whether the call
+        is cancelled.
+        """
+        with self._lock:
+            if self._state == self._PENDING:
+                self._state = self._CANCELLED
+            elif self._state != self._CANCELLED:
+                return False
+        self._finish()
+        return True
+
+    def set_running(self):
+        """
+        Marks the call as started, unless it was cancelled, in which case
+        False is returned and the call shouldn't be made.
+        """
+        with self._lock:
+            if self._state == self._CANCELLED:
+                return False
+            self._state = self._RUNNING
+            return True
+
+    def result(self, timeout=None):
+        """
+        Waits for the call to complete and returns its result, or re-raises
+        the exception it raised.
+        """
+        if not self._done.wait(timeout):
+            raise TimeoutError("Timed out waiting for the result.")
+        if self._state == self._CANCELLED:
+            raise CancelledError()
+        if self._exc_info is not None:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._result
+
+    def set_result(self, result):
+        self._result = result
+        self._state = self._FINISHED
+        self._finish()
+
+    def set_exception(self, exc_info):
+        """
+        Sets the outcome to an exception, given as returned by sys.exc_info.
+        """
+        self._exc_info = exc_info
+        self._state = self._FINISHED
+        self._finish()
+
+    def add_done_callback(self, callback):
+        """
+        Calls callback with the future once it's done (right away if it
+        already is).
+        """
+        with self._lock:
+            if not self._done.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def _finish(self):
+        with self._lock:
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+
+# pools whose threads are stopped at exit, before the interpreter goes away
+# from under them
+_worker_pools = weakref.WeakSet()
+
+@atexit.register
+def _shutdown_worker_pools():
+    for pool in list(_worker_pools):
+        pool.shutdown()
+
+
+class WorkerPool(object):
+    """
+    Runs submitted calls on at most workers daemon threads, which are
+    started as needed. Calls wait in a queue until a thread is free.
+    """
+    def __init__(self, workers=8):
+        self.workers = workers
+        self._queue = Queue.Queue()
+        self._lock = threading.Lock()
+        self._threads = []
+        _worker_pools.add(self)
+
+    def submit(self, function, *args, **kwargs):
+        """
+        Schedules function(*args, **kwargs) and returns a Future for it.
+        """
+        future = Future()
+        self._queue.put((future, function, args, kwargs))
+        with self._lock:
+            if len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._work)
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+        return future
+
+    def shutdown(self):
+        """
+        Stops the threads once the calls already submitted are done, and
+        waits for them. Calls submitted afterwards start new threads.
+        """
+        with self._lock:
+            threads, self._threads = self._threads, []
+            for _ in threads:
+                self._queue.put(None)
+        for thread in threads:
+            thread.join()
+
+    def _work(self):
+        while True:
+            work = self._queue.get()
+            if work is None:
+                return
+            future, function, args, kwargs = work
+            if not future.set_running():
+                continue
+            try:
+                future.set_result(function(*args, **kwargs))
+            except:
+                future.set_exception(sys.exc_info())
+            del work, future, function, args, kwargs
+
+
+class SingleFlight(object):
+    """
+    Coalesces concurrent calls made with the same key.
+
+    The first caller for a key runs the call; anyone asking for the same key
+    before it completes waits and gets the same result (or exception)
+    instead of running the call again. calls counts the calls actually run
+    and coalesced the ones that were served by another caller's call.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    def do(self, key, function, *args, **kwargs):
+        """
+        Returns function(*args, **kwargs), unless a call with the same key is
+        already running, in which case its result is returned.
+        """
+        with self._lock:
+            future = self._flights.get(key)
+            leader = future is None
+            if leader:
+                future = self._flights[key] = Future()
+                self.calls += 1
+            else:
+                self.coalesced += 1
+
+        if leader:
+            self._run(key, future, function, args, kwargs)
+        return future.result()
+
+    def submit(self, key, pool, function, *args, **kwargs):
+        """
+        Like do, but doesn't wait: unless a call with the same key is
+        already running, function(*args, **kwargs) is submitted to pool (a
+        WorkerPool). Returns a Future for the call's result.
+        """
+        with self._lock:
+            future = self._flights.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future
+            future = self._flights[key] = Future()
+            self.calls += 1
+        pool.submit(self._run, key, future, function, args, kwargs)
+        return future
+
+    def _run(self, key, future, function, args, kwargs):
+        try:
+            future.set_result(function(*args, **kwargs))
+        except:
+            future.set_exception(sys.exc_info())
+        finally:
+            with self._lock:
+                del self._flights[key]
+
+
+class ConnectionPool(object):
+    """
+    Bounded pool of connections, each used by a single thread at a time.
+
+    Connections are created by calling factory when needed, up to size of
+    them. Once they are all in use, callers wait until one is released.
+    Released connections are kept open for reuse, so factory should return
+    something that keeps its HTTP connections alive (like httplib2.Http).
+    """
+    def __init__(self, factory, size=4):
+        self.factory = factory
+        self.size = size
+        self._condition = threading.Condition()
+        self._idle = []
+        self._created = 0
+        self._generation = 0
+
+    @contextmanager
+    def connection(self):
+        """
+        Context manager lending a connection from the pool.
+        """
+        connection, generation = self._acquire()
+        try:
+            yield connection
+        finally:
+            self._release(connection, generation)
+
+    def _acquire(self):
+        with self._condition:
+            while not self._idle and self._created >= self.size:
+                self._condition.wait()
+            generation = self._generation
+            if self._idle:
+                return self._idle.pop(), generation
+            self._created += 1
+        try:
+            return self.factory(), generation
+        except:
+            with self._condition:
+                if generation == self._generation:
+                    self._created -= 1
+                self._condition.notify()
+            raise
+
+    def _release(self, connection, generation):
+        with self._condition:
+            # connections created before a clear are dropped
+            if generation == self._generation:
+                self._idle.append(connection)
+            self._condition.notify()
+
+    def clear(self):
+        """
+        Drops every connection, e.g. because the credentials they were
+        created with changed. Connections in use are dropped when released.
+        """
+        with self._condition:
+            self._idle = []
+            self._created = 0
+            self._generation += 1
+            self._condition.notify_all()
@@ -32,14 +32,243 @@ shouldn't completely break either until Vimeo seriously changes their API, keep
 in mind that if something in this module doesn't work, it still might work the
 "conventional" way using just the base module.
 """
-from os.path import getsize
+import binascii
+import hashlib
+import json
+import mmap
+import os
+import re
+import threading
+from cStringIO import StringIO
+from os.path import basename, getsize
 from urllib import urlencode
 
 import urllib2
 import oauth2
 import requests
 
-from . import VimeoClient, VimeoError, API_REST_URL
+from . import VimeoClient, VimeoAPIError, VimeoError, API_REST_URL
+from .concurrency import WorkerPool
+
+# the upload endpoint answers with the MD5 of what it received
+_MD5 = re.compile(r"\b[0-9a-fA-F]{32}\b")
+
+
+class _ChunkReader(object):
+    """
+    Read-only file-like view of a slice of a memory mapped file, so that a
+    chunk is only read from the file when it is sent.
+
+    The data is hashed as it is read, so the MD5 of a chunk that was sent
+    doesn't need another read of the file.
+    """
+    def __init__(self, map, offset, length, name="chunk"):
+        self.map = map
+        self.offset = offset
+        self.length = length
+        self.name = name
+        self.position = 0
+        self._md5 = hashlib.md5()
+        # number of bytes hashed, from the start of the chunk
+        self._hashed = 0
+
+    def __len__(self):
+        return self.length
+
+    def read(self, size=-1):
+        remaining = self.length - self.position
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+        start = self.offset + self.position
+        data = self.map[start:start + size]
+        if self.position == self._hashed:
+            self._md5.update(data)
+            self._hashed += size
+        self.position += size
+        return data
+
+    def seek(self, position, whence=0):
+        if whence == 1:
+            position += self.position
+        elif whence == 2:
+            position += self.length
+        self.position = min(max(position, 0), self.length)
+
+    def tell(self):
+        return self.position
+
+    def md5(self):
+        """
+        Returns the hex MD5 of the chunk.
+        """
+        if self._hashed != self.length:
+            # not read in order, hash it all over again
+            return hashlib.md5(self.map[self.offset:
+                                        self.offset + self.length]).hexdigest()
+        return self._md5.hexdigest()
+
+
+def _to_bytes(value):
+    if isinstance(value, unicode):
+        return value.encode("utf-8")
+    return str(value)
+
+
+class _MultipartBody(object):
+    """
+    multipart/form-data body made of some form fields and a file, read as
+    it is sent.
+
+    Only the framing is kept in memory, the file is read block by block
+    while the body is, so what's held at any time is bounded by the block
+    size whatever the size of the file.
+    """
+    block_size = 64 * 1024
+
+    def __init__(self, fields, name, open_file, boundary=None):
+        if boundary is None:
+            boundary = binascii.hexlify(os.urandom(16))
+        self.content_type = "multipart/form-data; boundary=" + boundary
+
+        head = []
+        for field, value in fields:
+            head.append("--{0}\r\nContent-Disposition: form-data; "
+                        "name=\"{1}\"\r\n\r\n".format(boundary,
+                                                      _to_bytes(field)))
+            head.append(_to_bytes(value) + "\r\n")
+        filename = basename(_to_bytes(getattr(open_file, "name", name)))
+        head.append("--{0}\r\nContent-Disposition: form-data; name=\"{1}\"; "
+                    "filename=\"{2}\"\r\nContent-Type: "
+                    "application/octet-stream\r\n\r\n".format(
+                                                    boundary, name, filename))
+        head = "".join(head)
+        tail = "\r\n--{0}--\r\n".format(boundary)
+
+        if hasattr(open_file, "__len__"):
+            file_length = len(open_file)
+        else:
+            file_length = (os.fstat(open_file.fileno()).st_size -
+                           open_file.tell())
+        self.length = len(head) + file_length + len(tail)
+        self._parts = [StringIO(head), open_file, StringIO(tail)]
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        while True:
+            block = self.read(self.block_size)
+            if not block:
+                return
+            yield block
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.length
+        blocks = []
+        while size > 0 and self._parts:
+            block = self._parts[0].read(size)
+            if not block:
+                self._parts.pop(0)
+                continue
+            blocks.append(block)
+            size -= len(block)
+        return "".join(blocks)
+
+
+class _UploadJournal(object):
+    """
+    Append-only record of a chunked upload, to resume it after a crash.
+
+    The first line is a json header describing the ticket, the file and its
+    chunks, each following line the json [chunk_id, md5] of a chunk the
+    endpoint acknowledged.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def load(self):
+        """
+        Returns the header and a dict mapping the acknowledged chunk ids to
+        their MD5, or None and an empty dict if there is no usable journal.
+        """
+        try:
+            with open(self.path) as journal:
+                lines = journal.read().splitlines()
+        except EnvironmentError:
+            return None, {}
+        try:
+            header = json.loads(lines[0])
+        except (IndexError, ValueError):
+            return None, {}
+        acknowledged = {}
+        for line in lines[1:]:
+            try:
+                chunk_id, md5 = json.loads(line)
+            except ValueError:
+                # torn by a crash while it was written
+                break
+            acknowledged[chunk_id] = md5
+        return header, acknowledged
+
+    def start(self, header, acknowledged):
+        """
+        Rewrites the journal with header and the acknowledged chunks, and
+        keeps it open to record the next ones.
+        """
+        partial = self.path + ".tmp"
+        with open(partial, "w") as journal:
+            journal.write(json.dumps(header) + "\n")
+            for chunk_id, md5 in sorted(acknowledged.iteritems()):
+                journal.write(json.dumps([chunk_id, md5]) + "\n")
+        os.rename(partial, self.path)
+        self._file = open(self.path, "a")
+
+    def acknowledge(self, chunk_id, md5):
+        self._file.write(json.dumps([chunk_id, md5]) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def remove(self):
+        self.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+def _verified_chunks(response):
+    """
+    Returns a dict mapping the ids of the chunks in a processed json
+    verifyChunks response to their size.
+    """
+    chunks = {}
+
+    def walk(value):
+        if isinstance(value, list):
+            for item in value:
+                walk(item)
+        elif isinstance(value, dict):
+            for name, item in value.iteritems():
+                if name == "chunk":
+                    for chunk in item if isinstance(item, list) else [item]:
+                        chunks[int(chunk["id"])] = int(chunk["size"])
+                else:
+                    walk(item)
+    walk(response)
+    return chunks
+
+
+def _xml_manifest(manifest):
+    return ('<?xml version="1.0" encoding="utf-8"?><files>{0}</files>'.format(
+                "".join('<file md5="{0}" />'.format(file["md5"])
+                        for file in manifest["files"])))
 
 
 class VimeoUploader(object):
@@ -48,13 +277,28 @@ class VimeoUploader(object):
 
     The ticket is assumed to be a dict-like object, which means that if you
     aren't using a JSON client the ticket will need to be converted first.
+
+    After a chunked upload, manifest holds the MD5s of the chunks in order,
+    as sent to verifyManifest.
+
+    Chunked uploads given a journal (a file path) record their progress in
+    it. If the upload is interrupted, an uploader created with resume (or
+    the client's get_uploader) from the same journal sends only the chunks
+    the endpoint doesn't have yet when upload is called again.
     """
+    # where verifyManifest is POSTed to
+    api_url = API_REST_URL
+
     def __init__(self, vimeo_client, ticket, **kwargs):
         self.vimeo_client = vimeo_client
         self.endpoint = ticket["endpoint"]
         self.ticket_id = ticket["id"]
         self.max_file_size = ticket["max_file_size"]
         self.chunk_id = 0
+        self.manifest = {"files" : []}
+        self.journal = kwargs.pop("journal", None)
+        self._local = threading.local()
+        self._sessions = []
 
         self.user = getattr(vimeo_client, "user", None)
 
@@ -63,59 +307,298 @@ class VimeoUploader(object):
         self.has_hd_quota = bool(quota.get("hd_quota", None))
         self.upload_space = quota.get("upload_space", {})
 
+    @classmethod
+    def resume(cls, vimeo_client, journal, **kwargs):
+        """
+        Returns an uploader for the ticket recorded in journal, or None if
+        there's no usable journal there.
+        """
+        header, _ = _UploadJournal(journal).load()
+        if header is None:
+            return None
+        return cls(vimeo_client, header["ticket"], journal=journal, **kwargs)
+
     def _check_file_size(self, file_size):
         if file_size > self.upload_space.get("free", file_size):
             raise VimeoError("Not enough free space to upload the file.")
         elif file_size > self.max_file_size:
             raise VimeoError("File is larger than the maximum allowed size.")
 
-    def _post_to_endpoint(self, open_file, **kwargs):
-        params = {"chunk_id" : self.chunk_id,
-                  "ticket_id" : self.ticket_id}
-
-        headers = kwargs.get("headers",
-                             dict(self.vimeo_client._CLIENT_HEADERS))
-
+    def _sign(self, url, params):
+        """
+        Returns a signed POST request to url with params. Data sent along
+        (file data, manifests) is left out of the signature.
+        """
         request = oauth2.Request.from_consumer_and_token(
                                           consumer=self.vimeo_client.consumer,
                                           token=self.vimeo_client.token,
                                           http_method="POST",
-                                          http_url=self.endpoint,
+                                          http_url=url,
                                           parameters=params)
 
         request.sign_request(self.vimeo_client.signature_method,
                              self.vimeo_client.consumer,
                              self.vimeo_client.token)
+        return request
 
-        files = {"file_data" : open_file}
-        return requests.post(
-            self.endpoint, data=request, files=files, headers=headers)
+    def _session(self):
+        """
+        Returns the requests session of the current thread, so that each
+        thread uploading chunks keeps its own connection to the endpoint.
+        """
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+            self._sessions.append(session)
+        return session
+
+    def _close_sessions(self):
+        sessions, self._sessions = self._sessions, []
+        for session in sessions:
+            session.close()
+        self._local = threading.local()
+
+    def _post_to_endpoint(self, open_file, chunk_id=None, **kwargs):
+        if chunk_id is None:
+            chunk_id = self.chunk_id
+        params = {"chunk_id" : chunk_id,
+                  "ticket_id" : self.ticket_id}
+
+        headers = dict(kwargs.get("headers",
+                                  self.vimeo_client._CLIENT_HEADERS))
 
+        request = self._sign(self.endpoint, params)
+
+        # streamed rather than built in memory like requests does for files
+        body = _MultipartBody(sorted(request.items()), "file_data", open_file)
+        headers["Content-Type"] = body.content_type
+        response = self._session().post(
+            self.endpoint, data=body, headers=headers)
+        if response.status_code != 200:
+            raise VimeoError("Upload failed with status {0}.".format(
+                                                        response.status_code))
+        return response
+
+    def _upload_chunk(self, file_map, name, chunk_id, offset, length):
+        """
+        Sends a chunk and returns its MD5, after checking that the endpoint
+        got the same MD5 as what was sent.
+        """
+        chunk = _ChunkReader(file_map, offset, length,
+                             name="{0}.{1}".format(name, chunk_id))
+        response = self._post_to_endpoint(chunk, chunk_id=chunk_id)
+        md5 = _MD5.search(response.content)
+        if md5 is None:
+            raise VimeoError(
+                "No MD5 for chunk {0} in the upload response.".format(
+                                                                chunk_id))
+        md5 = md5.group(0).lower()
+        if md5 != chunk.md5():
+            raise VimeoError(
+                "Chunk {0} was corrupted: its MD5 is {1}, the endpoint got "
+                "{2}.".format(chunk_id, chunk.md5(), md5))
+        return md5
+
+    def _check_ticket(self):
+        """
+        Checks that the ticket of a resumed upload is still valid, and gets
+        a new one if it expired. Returns whether the ticket was kept.
+        """
+        client = self.vimeo_client
+        try:
+            ticket = client.call("vimeo_videos_upload_checkTicket",
+                                 ticket_id=self.ticket_id, format="json")
+        except VimeoAPIError as e:
+            raise VimeoError("Can't resume the upload: {0}".format(e))
+        if str(ticket.get("valid", "1")) != "0":
+            self.endpoint = ticket.get("endpoint", self.endpoint)
+            return True
+        # what was sent with the old ticket is gone, start over
+        ticket = client.call("vimeo_videos_upload_getTicket", format="json")
+        self.endpoint = ticket["endpoint"]
+        self.ticket_id = ticket["id"]
+        self.max_file_size = ticket["max_file_size"]
+        return False
+
+    def _confirmed_chunks(self, header, acknowledged):
+        """
+        Returns the acknowledged chunks of a journal that the endpoint still
+        has.
+        """
+        if not acknowledged:
+            return {}
+        client = self.vimeo_client
+        verified = _verified_chunks(client.call(
+                                    "vimeo_videos_upload_verifyChunks",
+                                    ticket_id=self.ticket_id, format="json"))
+        return dict((chunk_id, md5)
+                    for chunk_id, md5 in acknowledged.iteritems()
+                    if chunk_id < len(header["chunks"]) and
+                       verified.get(chunk_id) == header["chunks"][chunk_id][1])
+
+    def _start_journal(self, file_path, file_size, chunk_size):
+        """
+        Opens the journal and returns the chunks it says were already
+        uploaded, by chunk id.
+        """
+        journal = _UploadJournal(self.journal)
+        header, acknowledged = journal.load()
+        stat = os.stat(file_path)
+        chunk_count = max((file_size + chunk_size - 1) // chunk_size, 1)
+        chunks = [[offset, min(chunk_size, file_size - offset)]
+                  for offset in xrange(0, chunk_count * chunk_size,
+                                       chunk_size)]
+        file = {"path" : os.path.abspath(file_path),
+                "size" : file_size,
+                "mtime" : stat.st_mtime}
+        if (header is not None and header["ticket"]["id"] == self.ticket_id
+            and self._check_ticket() and header["file"] == file and
+            header["chunks"] == chunks):
+            acknowledged = self._confirmed_chunks(header, acknowledged)
+        else:
+            acknowledged = {}
+        # the ticket may have been replaced by a new one
+        new_header = {"ticket" : {"id" : self.ticket_id,
+                                  "endpoint" : self.endpoint,
+                                  "max_file_size" : self.max_file_size},
+                      "file" : file,
+                      "chunks" : chunks}
+        journal.start(new_header, acknowledged)
+        return journal, acknowledged
+
+    def _upload_chunks(self, open_file, file_size, chunk_size,
+                       chunk_complete_hook, connections, retries,
+                       journaled=True):
+        chunk_count = max((file_size + chunk_size - 1) // chunk_size, 1)
+        name = open_file.name.rpartition("/")[2]
+        md5s = [None] * chunk_count
+        journal = None
+        if journaled and self.journal is not None:
+            journal, acknowledged = self._start_journal(open_file.name,
+                                                        file_size, chunk_size)
+            for chunk_id, md5 in acknowledged.iteritems():
+                md5s[chunk_id] = md5
+        if not file_size:
+            # an empty file can't be mapped, send a single empty chunk
+            file_map = ""
+        else:
+            file_map = mmap.mmap(open_file.fileno(), 0,
+                                 access=mmap.ACCESS_READ)
+        pending = [chunk_id for chunk_id in xrange(chunk_count)
+                   if md5s[chunk_id] is None]
+        workers = WorkerPool(max(min(connections, len(pending)), 1))
+        try:
+            # the first round sends every chunk, the next ones only those
+            # that failed
+            for _ in xrange(retries + 1):
+                futures = [(chunk_id, workers.submit(
+                                self._upload_chunk, file_map, name, chunk_id,
+                                chunk_id * chunk_size,
+                                min(chunk_size,
+                                    file_size - chunk_id * chunk_size)))
+                           for chunk_id in pending]
+                pending = []
+                for chunk_id, future in futures:
+                    try:
+                        md5s[chunk_id] = future.result()
+                    except (VimeoError, requests.RequestException) as e:
+                        pending.append(chunk_id)
+                        error = e
+                        continue
+                    if journal is not None:
+                        journal.acknowledge(chunk_id, md5s[chunk_id])
+                    if chunk_complete_hook is not None:
+                        chunk_complete_hook(chunk_id, chunk_count,
+                                            md5s[chunk_id])
+                if not pending:
+                    break
+            else:
+                raise VimeoError("Failed to upload chunks {0}: {1}".format(
+                    ", ".join(str(chunk_id) for chunk_id in pending), error))
+        finally:
+            workers.shutdown()
+            self._close_sessions()
+            if file_size:
+                file_map.close()
+            if journal is not None:
+                journal.close()
+        self.manifest = {"files" : [{"md5" : md5} for md5 in md5s]}
 
     def upload(self, file_path, chunk=False, chunk_size=2*1024*1024,
-               chunk_complete_hook=None):
+               chunk_complete_hook=None, connections=1, retries=3):
         """
         Performs the steps of an upload. Checks file size and can handle
         splitting into chunks.
+
+        When chunk is set, the file is sent in chunks of chunk_size bytes,
+        each read from the memory mapped file as it is sent, over up to
+        connections concurrent connections. Chunks that fail are sent again,
+        up to retries more times. As chunks complete, chunk_complete_hook
+        (if given) is called in order with the chunk's id, the number of
+        chunks and the chunk's MD5. The manifest of the chunks is then
+        verified with verify_manifest.
+
+        With a journal, the chunks recorded in it are checked with
+        checkTicket and verifyChunks, and the ones the endpoint has are not
+        sent again, as long as the file and chunk_size didn't change. If
+        the ticket expired, a new one is used and every chunk is sent.
+
+        The MD5 of what is sent (each chunk, or the whole file) is computed
+        as it is sent and compared with the one the endpoint returns. A
+        mismatch counts as a failure, retried like the others.
+
+        Returns the response of verifyChunks.
         """
 
         file_size = getsize(file_path)
         self._check_file_size(file_size)
 
-        ## FIXME something is missing
-        if chunk:
-            self.chunk_id += 1
-        else:
-            self._post_to_endpoint(open(file_path))
+        with open(file_path, "rb") as open_file:
+            if chunk:
+                self._upload_chunks(open_file, file_size, chunk_size,
+                                    chunk_complete_hook, connections, retries)
+            else:
+                # the whole file as a single chunk
+                self._upload_chunks(open_file, file_size, max(file_size, 1),
+                                    None, 1, retries, journaled=False)
 
+        if chunk:
+            self.verify_manifest()
+        return self.vimeo_client.call("vimeo_videos_upload_verifyChunks",
+                                      ticket_id=self.ticket_id)
 
-        return self.vimeo_client.vimeo_videos_upload_verifyChunks(
-                                                ticket_id=self.ticket_id)
+    def verify_manifest(self, manifest=None, xml=False):
+        """
+        POSTs the manifest (by default the one of the last chunked upload)
+        to vimeo.videos.upload.verifyManifest, as json_manifest or, with
+        xml, as xml_manifest. Returns the processed response, which gives
+        the MD5 of the combined file.
+        """
+        if manifest is None:
+            manifest = self.manifest
+        if xml:
+            manifest_param = ("xml_manifest", _xml_manifest(manifest))
+        else:
+            manifest_param = ("json_manifest", json.dumps(manifest))
+        client = self.vimeo_client
+        format = client.default_response_format
+        request = self._sign(self.api_url,
+                             {"method" : "vimeo.videos.upload.verifyManifest",
+                              "ticket_id" : self.ticket_id,
+                              "format" : format})
+        data = dict(request)
+        data[manifest_param[0]] = manifest_param[1]
+        response = requests.post(self.api_url, data=data,
+                                 headers=client._CLIENT_HEADERS)
+        return client._processor(format)(response.headers, response.content)
 
     def complete(self):
         """
-        Finish an upload.
+        Finish an upload. The journal, if any, is removed.
         """
-        return self.vimeo_client.vimeo_videos_upload_complete(
-                                                ticket_id=self.ticket_id)
+        response = self.vimeo_client.call("vimeo_videos_upload_complete",
+                                          ticket_id=self.ticket_id)
+        if self.journal is not None:
+            _UploadJournal(self.journal).remove()
+        return response
 
@@ -0,0 +1,175 @@
+# Copyright 2010 Julian Berman
+# The MIT License
+#
+# Copyright (c) 2010
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+Catalog of the known Vimeo Advanced API (v2) methods.
+
+VimeoClient gets a real method for each of these, named like the API method
+with dots replaced by underscores (vimeo_videos_getInfo for
+vimeo.videos.getInfo). Methods missing from the catalog can still be called,
+they are just created the first time they are used.
+"""
+
+# anything on this list can have its methods called without adding vimeo_ to
+# the beginning (so videos_getInfo works, for example)
+KNOWN_API_GROUPS = ("activity", "albums", "channels", "contacts", "groups",
+                    "oauth", "people", "test", "videos")
+
+API_METHODS = (
+    "vimeo_albums_addVideo",
+    "vimeo_albums_create",
+    "vimeo_albums_delete",
+    "vimeo_albums_getAll",
+    "vimeo_albums_getVideos",
+    "vimeo_albums_removeVideo",
+    "vimeo_albums_setDescription",
+    "vimeo_albums_setPassword",
+    "vimeo_albums_setTitle",
+
+    "vimeo_channels_addVideo",
+    "vimeo_channels_getAll",
+    "vimeo_channels_getInfo",
+    "vimeo_channels_getModerators",
+    "vimeo_channels_getSubscribers",
+    "vimeo_channels_getVideos",
+    "vimeo_channels_removeVideo",
+    "vimeo_channels_setDescription",
+    "vimeo_channels_setPassword",
+    "vimeo_channels_subscribe",
+    "vimeo_channels_unsubscribe",
+
+    "vimeo_contacts_getAll",
+    "vimeo_contacts_getMutual",
+    "vimeo_contacts_getOnline",
+    "vimeo_contacts_getWhoAdded",
+
+    "vimeo_groups_addVideo",
+    "vimeo_groups_getAll",
+    "vimeo_groups_getFiles",
+    "vimeo_groups_getInfo",
+    "vimeo_groups_getMembers",
+    "vimeo_groups_getModerators",
+    "vimeo_groups_getVideoComments",
+    "vimeo_groups_join",
+    "vimeo_groups_leave",
+
+    "vimeo_test_echo",
+    "vimeo_test_login",
+    "vimeo_test_null",
+
+    "vimeo_videos_addCast",
+    "vimeo_videos_addPhotos",
+    "vimeo_videos_addTags",
+    "vimeo_videos_clearTags",
+    "vimeo_videos_delete",
+    "vimeo_videos_getAll",
+    "vimeo_videos_getAppearsIn",
+    "vimeo_videos_getByTag",
+    "vimeo_videos_getCast",
+    "vimeo_videos_getContactsLiked",
+    "vimeo_videos_getContactsUploaded",
+    "vimeo_videos_getInfo",
+    "vimeo_videos_getLikes",
+    "vimeo_videos_getSourceFileUrls",
+    "vimeo_videos_getSubscriptions",
+    "vimeo_videos_getThumbnailUrls",
+    "vimeo_videos_getUploaded",
+    "vimeo_videos_removeCast",
+    "vimeo_videos_removeTag",
+    "vimeo_videos_search",
+    "vimeo_videos_setDescription",
+    "vimeo_videos_setLike",
+    "vimeo_videos_setPrivacy",
+    "vimeo_videos_setTitle",
+
+    "vimeo_videos_comments_addComment",
+    "vimeo_videos_comments_deleteComment",
+    "vimeo_videos_comments_editComment",
+    "vimeo_videos_comments_getList",
+
+    "vimeo_videos_embed_getPresets",
+    "vimeo_videos_embed_setPreset",
+
+    "vimeo_videos_upload_checkTicket",
+    "vimeo_videos_upload_complete",
+    "vimeo_videos_upload_confirm",
+    "vimeo_videos_upload_getQuota",
+    "vimeo_videos_upload_getTicket",
+    "vimeo_videos_upload_verifyChunks",
+    "vimeo_videos_upload_verifyManifest",
+    )
+
+# the methods of the catalog that change something: they are never cached,
+# and invalidate the cached responses about the entities they are given
+WRITE_METHODS = frozenset((
+    "vimeo_albums_addVideo",
+    "vimeo_albums_create",
+    "vimeo_albums_delete",
+    "vimeo_albums_removeVideo",
+    "vimeo_albums_setDescription",
+    "vimeo_albums_setPassword",
+    "vimeo_albums_setTitle",
+
+    "vimeo_channels_addVideo",
+    "vimeo_channels_removeVideo",
+    "vimeo_channels_setDescription",
+    "vimeo_channels_setPassword",
+    "vimeo_channels_subscribe",
+    "vimeo_channels_unsubscribe",
+
+    "vimeo_groups_addVideo",
+    "vimeo_groups_join",
+    "vimeo_groups_leave",
+
+    "vimeo_videos_addCast",
+    "vimeo_videos_addPhotos",
+    "vimeo_videos_addTags",
+    "vimeo_videos_clearTags",
+    "vimeo_videos_delete",
+    "vimeo_videos_removeCast",
+    "vimeo_videos_removeTag",
+    "vimeo_videos_setDescription",
+    "vimeo_videos_setLike",
+    "vimeo_videos_setPrivacy",
+    "vimeo_videos_setTitle",
+
+    "vimeo_videos_comments_addComment",
+    "vimeo_videos_comments_deleteComment",
+    "vimeo_videos_comments_editComment",
+
+    "vimeo_videos_embed_setPreset",
+    ))
+
+
+def make_api_method(name):
+    """
+    Returns a function to be set on VimeoClient that calls the API method
+    name (e.g. vimeo_videos_getInfo).
+    """
+    api_method = name.replace("_", ".")
+
+    def call_api(self, **params):
+        return self._dispatch(name, api_method, params)
+    call_api.__name__ = name
+    call_api.__doc__ = "Calls the {0} API method.".format(api_method)
+    return call_api
@@ -0,0 +1,175 @@
+# Copyright 2010 Julian Berman
+# The MIT License
+#
+# Copyright (c) 2010
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+Compact, lazily decoded views of the entities returned by the API.
+
+A JSONProcessor created with views=True (see the views parameter of
+VimeoClient) returns these instead of dicts for videos, users, channels,
+albums and comments. Each view only keeps the entity as a compact json
+string, decoded when its fields are read, which takes a fraction of the
+memory of the dicts.
+"""
+import json
+import threading
+from collections import OrderedDict
+
+_encode = json.JSONEncoder(separators=(",", ":")).encode
+_decode = json.JSONDecoder().decode
+
+# the entities decoded last by each thread, so that reading several fields
+# of a view decodes it once without the view keeping its decoded fields
+_RECENT_DECODED = 16
+_recent = threading.local()
+
+
+def _fields(raw):
+    last = getattr(_recent, "last", None)
+    if last is not None and last[0] is raw:
+        return last[1]
+    recent = getattr(_recent, "fields", None)
+    if recent is None:
+        recent = _recent.fields = OrderedDict()
+    # keyed by id, the raw string being kept alive alongside its fields
+    found = recent.pop(id(raw), None)
+    if found is None or found[0] is not raw:
+        found = (raw, _decode(raw))
+        if len(recent) >= _RECENT_DECODED:
+            recent.popitem(last=False)
+    recent[id(raw)] = _recent.last = found
+    return found[1]
+
+
+class Entity(object):
+    """
+    Read-only view of an API entity.
+
+    Fields can be read like dict items (video["title"], video.get("title"))
+    or as attributes (video.title). to_dict returns the whole entity.
+    """
+    __slots__ = ("_raw",)
+
+    def __init__(self, raw):
+        self._raw = raw
+
+    @classmethod
+    def from_dict(cls, entity):
+        return cls(_encode(entity))
+
+    def __getitem__(self, name):
+        return _fields(self._raw)[name]
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(
+                "{0} has no field {1}.".format(type(self).__name__, name))
+
+    def __contains__(self, name):
+        return name in _fields(self._raw)
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self._raw == other._raw
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __getstate__(self):
+        return self._raw
+
+    def __setstate__(self, raw):
+        self._raw = raw
+
+    def __repr__(self):
+        return "<{0} {1}>".format(type(self).__name__, self.get("id"))
+
+    def get(self, name, default=None):
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return _fields(self._raw).keys()
+
+    def to_dict(self):
+        return _decode(self._raw)
+
+
+class Video(Entity):
+    __slots__ = ()
+
+class User(Entity):
+    __slots__ = ()
+
+class Channel(Entity):
+    __slots__ = ()
+
+class Album(Entity):
+    __slots__ = ()
+
+class Comment(Entity):
+    __slots__ = ()
+
+
+# key the entities are found under in responses -> view class
+VIEWS = {"album" : Album,
+         "channel" : Channel,
+         "comment" : Comment,
+         "contact" : User,
+         "member" : User,
+         "moderator" : User,
+         "person" : User,
+         "subscriber" : User,
+         "user" : User,
+         "video" : Video}
+
+
+def _view(cls, value):
+    if isinstance(value, list):
+        return [cls.from_dict(entity) if isinstance(entity, dict) else entity
+                for entity in value]
+    if isinstance(value, dict):
+        return cls.from_dict(value)
+    return value
+
+
+def to_views(key, content):
+    """
+    Replaces the entities in the processed json content found under key in
+    the response (e.g. "video" for videos.getInfo, "videos" for listings)
+    by views.
+    """
+    cls = VIEWS.get(key)
+    if cls is not None:
+        return _view(cls, content)
+    if isinstance(content, dict):
+        # a listing: {"page" : ..., "video" : [...]}
+        content = dict(content)
+        for name, value in content.items():
+            if name in VIEWS:
+                content[name] = _view(VIEWS[name], value)
+    return content